@@ -0,0 +1,67 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Benchmark documents with huge appendices.
+
+Converts bibliography-like documents citing a growing number of
+different references (every one of them several times, the way
+bibliographies and link dumps do) and prints the time and the
+memory kept by the Converter per reference, which should stay flat.
+
+Usage:
+python3 benchmarks/bibliography.py [--sizes 5000 10000 20000 40000]
+'''
+
+from __future__ import unicode_literals
+import io
+import os
+import sys
+import argparse
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from plaintextref import Converter
+
+def bibliography(refs):
+    """Return the lines of a document citing refs different
+    references three times and refs different URLs once.
+    """
+    text = io.StringIO()
+    for no in range(refs):
+        text.write('Cited [Author {0}, Title {0}] and '
+            '(https://example.com/{0}).\n'.format(no))
+    for _ in range(2):
+        for no in range(refs):
+            text.write('Again [Author {0}, Title {0}].\n'.format(no))
+    return text.getvalue().splitlines(True)
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark documents '
+        'with huge appendices')
+    parser.add_argument('--sizes', type=int, nargs='+',
+        default=[5000, 10000, 20000, 40000],
+        help='numbers of different references to cite')
+    args = parser.parse_args()
+
+    print("{:>8} {:>10} {:>14} {:>14}".format('refs', 'seconds',
+        'us per ref', 'bytes per ref'))
+    for refs in args.sizes:
+        lines = bibliography(refs)
+        tracemalloc.start()
+        start = time.process_time()
+        converter = Converter()
+        converter.old_refs(lines)
+        for line in converter.convert_lines(lines):
+            pass
+        seconds = time.process_time() - start
+        kept = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        count = len(converter.references)
+        print("{:>8} {:>10.3f} {:>14.1f} {:>14.0f}".format(count, seconds,
+            seconds / count * 1000000, kept / count))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Generate synthetic text and HTML documents for benchmarks.
+
+Documents are built from random prose with a configurable density of
+references (URLs in round brackets, citations in square brackets),
+of round bracket asides and quoted square brackets which stay in the
+text, and of existing references belonging to an old appendix.
+HTML documents consist of nested div elements holding paragraphs
+with hyperlinks and entities.
+
+Usage:
+python3 benchmarks/corpus.py text -o corpus.txt [--size 1000000]
+python3 benchmarks/corpus.py html -o corpus.html [--links 5000] [--depth 4]
+'''
+
+from __future__ import unicode_literals
+import io
+import sys
+import random
+import argparse
+
+WORDS = ('the of and to in is was for on that with as by at from this '
+    'reference footnote appendix mailing list archive digest message '
+    'plaintext conversion document citation hyperlink paragraph sentence '
+    'Thranduil Thorin Bard dwarves king Dale Erebor Mirkwood').split()
+
+def sentence(rand, words):
+    """Return a random sentence of the given number of words.
+    """
+    text = ' '.join(rand.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + '.'
+
+def reference(rand, links, refs):
+    """Return a random reference: a URL in round brackets
+    (with probability links) or a citation in square brackets.
+    Out of refs different references.
+    """
+    no = rand.randrange(refs)
+    if rand.random() < links:
+        return '(https://example.com/{}/page-{})'.format(no % 97, no)
+    return '[{}, p. {}]'.format(rand.choice(WORDS).capitalize(), no)
+
+def text_document(size=1000000, density=0.3, links=0.5, refs=1000,
+        asides=0.1, appendix=0, seed=0):
+    """Return a text document of about size characters.
+
+    density is the probability of a sentence containing a reference,
+    links the share of URLs among references and refs the number of
+    different references. asides is the probability of a sentence
+    containing text in round brackets or square brackets in quotes.
+    appendix is the size of an old appendix: the document then ends
+    with one and sentences also contain existing references like [3].
+    """
+    rand = random.Random(seed)
+    out = io.StringIO()
+    length = 0
+    while length < size:
+        line = []
+        for _ in range(rand.randint(1, 4)):
+            words = sentence(rand, rand.randint(6, 18))
+            kind = rand.random()
+            if kind < density:
+                words = words[:-1] + ' ' + reference(rand, links, refs) + '.'
+            elif kind < density + asides:
+                if rand.random() < 0.5:
+                    words = words[:-1] + ' (or so ' + rand.choice(WORDS) + ').'
+                else:
+                    words = '"' + words[:-1] + ' [sic]" he said.'
+            if appendix > 0 and rand.random() < density:
+                words = words[:-1] + ' [{}].'.format(rand.randint(1, appendix))
+            line.append(words)
+        line = ' '.join(line) + '\n'
+        if rand.random() < 0.2:
+            line += '\n'
+        out.write(line)
+        length += len(line)
+    if appendix > 0:
+        out.write('\n___\n')
+        for no in range(1, appendix + 1):
+            out.write('[{}] https://old.example.org/{}\n'.format(no, no))
+    return out.getvalue()
+
+def html_document(size=1000000, links=5000, depth=4, entities=0.2, seed=0):
+    """Return an HTML document of about size characters.
+
+    links is the number of hyperlinks (spread evenly over the
+    document), depth the nesting depth of div elements and entities
+    the probability of a sentence containing HTML entities.
+    """
+    rand = random.Random(seed)
+    out = io.StringIO()
+    out.write('<!DOCTYPE html>\n<html>\n<head>\n<title>Benchmark</title>\n'
+        '<style>p { margin: 0; }</style>\n</head>\n<body>\n')
+    length = 0
+    paragraphs = max(1, size // 400)
+    link_probability = float(links) / paragraphs
+    while length < size:
+        level = rand.randint(1, max(1, depth))
+        html = ['  ' * no + '<div class="level{}">\n'.format(no)
+            for no in range(level)]
+        text = []
+        for _ in range(rand.randint(2, 5)):
+            words = sentence(rand, rand.randint(6, 18))
+            if rand.random() < entities:
+                words = words.replace(' and ', ' &amp; ', 1) + '&nbsp;&ndash;'
+            text.append(words)
+        # distribute links over paragraphs
+        count = int(link_probability)
+        if rand.random() < link_probability - count:
+            count += 1
+        for _ in range(count):
+            no = rand.randrange(max(1, links))
+            anchor = '<a href="https://example.com/{}">{}</a>'.format(no,
+                sentence(rand, 3)[:-1])
+            text.insert(rand.randint(0, len(text)), anchor)
+        indent = '  ' * level
+        html.append(indent + '<p>\n' + indent + '  ' + ('\n' + indent + '  ').join(text)
+            + '\n' + indent + '</p>\n')
+        if rand.random() < 0.3:
+            html.append(indent + 'Line one<br>\n' + indent + 'line two<br />\n')
+        html.extend('  ' * no + '</div>\n' for no in reversed(range(level)))
+        html = ''.join(html)
+        out.write(html)
+        length += len(html)
+    out.write('<script>\nvar tracking = 1;\n</script>\n</body>\n</html>\n')
+    return out.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser(description='generate benchmark documents')
+    parser.add_argument('kind', choices=['text', 'html'])
+    parser.add_argument('-o', '--output', default='-',
+        help='file to write the document to (default: stdout)')
+    parser.add_argument('--size', type=int, default=1000000,
+        help='approximate size in characters')
+    parser.add_argument('--density', type=float, default=0.3,
+        help='text: probability of a sentence containing a reference')
+    parser.add_argument('--url-share', dest='links_share', type=float, default=0.5,
+        help='text: share of URLs among references')
+    parser.add_argument('--refs', type=int, default=1000,
+        help='text: number of different references')
+    parser.add_argument('--appendix', type=int, default=0,
+        help='text: size of an old appendix to re-index')
+    parser.add_argument('--links', type=int, default=5000,
+        help='html: number of hyperlinks')
+    parser.add_argument('--depth', type=int, default=4,
+        help='html: nesting depth of div elements')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.kind == 'text':
+        document = text_document(args.size, args.density, args.links_share,
+            args.refs, appendix=args.appendix, seed=args.seed)
+    else:
+        document = html_document(args.size, args.links, args.depth,
+            seed=args.seed)
+    if args.output == '-':
+        sys.stdout.write(document)
+    else:
+        with io.open(args.output, 'w', encoding='utf-8') as f:
+            f.write(document)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Check that HTML read in chunks gives the same plaintext as read whole,
+and that HTMLFast reads HTML like html.parser of the running Python.
+
+Converts known cases and random documents, well-formed (see corpus.py)
+and malformed ones made up of pieces of HTML, fed in random chunks and
+character by character to HTMLStream (like -S and stdin do), and
+compares the result with HTMLClean reading each document whole. Every
+document is also read by HTMLFast, whose rules for malformed HTML are
+copied from html.parser of Python 3.11, and compared with HTMLClean
+fed the same chunks; run this on every new version of Python.
+The starting point given by -b is looked for in chunks of any size
+as well. Exits with status 1 if any document gives a different result.
+
+Usage:
+python3 benchmarks/htmlcheck.py [--documents 5000] [--seed 0]
+'''
+
+from __future__ import unicode_literals
+import os
+import sys
+import argparse
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from plaintextref import (html_to_text, iter_html_to_text, HTMLClean,
+    HTMLFast, HTML_FAST_CHECKS, Converter)
+from corpus import html_document
+
+# documents in chunks which gave a different result before
+KNOWN = [
+    ['text<br/></ p><script', "></script>&#x41;a < b<!-- c -->)<a href='htt",
+        "p://b.org'><di", 'v>\n'],
+    ['<3&', '#160;</style ', '>', '&amp;<b', '><a/>'],
+    ['< p></>', '</>&&bogus;<p ', '=x></s', 'crip', 't>text'],
+    ['=', '<<', '/', 'scr', 'ipt>'],
+    ['&bogus;<p x=', '=y><b/x>Wo', "rd&'"],
+    ['<p>Alpha beta</p>' + '<b>y</b>' * 70 + '</p>'
+        + '<script></script>' * 75 + 'tail'],
+]
+
+# starting points (-b, with or without -c) split up between chunks
+BEGIN = [
+    ('<body>', False, ['Junk', '<b', 'o', 'dy>text']),
+    ('<body>', True, ['Junk', '<b', 'o', 'dy>text']),
+    ('<body>', False, ['<', 'b', 'o', 'd', 'y', '>', 'text']),
+    ('<main id="x">', False, ['<p>a</p><ma', 'in id="x">', '<p>b</p>']),
+    ('missing', False, ['<p>a', '</p>', 'b']),
+]
+
+# pieces of HTML random documents are made up of
+PIECES = ['<p>', '</p>', '<div class="x">', '</div>', '<br>', '<br/>',
+    '<br />', '<BR>', '<a href="http://x.y/a">', '<a href=\'http://q.r\'>',
+    '<a href=http://u.v/w/>', '<a name=top>', '</a>', '</A>',
+    '<A HREF="HTTP://X.Y">', '<a href="mailto:me@x.y">', '<a href="">',
+    '<script>', '</script>', '<script type="x">var a = "<p>";</script>',
+    '<style>p{}</style>', '<STYLE>', '</style >', '</script\n>',
+    '<!-- c -->', '<!--', '-->', '<!DOCTYPE html>', '<!x>', '<?php x ?>',
+    '<![CDATA[ x ]]>', '< p>', '<', '>', '&', '&amp;', '&nbsp;', '&#160;',
+    '&#x41;', '&bogus;', '&amp', '&eacute', 'text', ' ', '\n', '\n\n',
+    'Word', 'x y', '"', "'", '=', '<b>', '</b>', '<span a=1 b="2" c>',
+    '<i/>', '<p/>', '<div/>', '<a/>', '<b x=y/>', '<b/x>', '</>', '</ p>',
+    '</p x>', '</1>', '<x y="z', '<p x==y>', '<br\n/>', '<3', 'a<b']
+
+def read(backend, chunks):
+    """Feed the chunks to a new instance of backend and return
+    what it read.
+    """
+    content = backend()
+    for chunk in chunks:
+        content.feed(chunk)
+    return content.result, content.anchors, content.concatenate()
+
+def chunked(rand, document):
+    """Split document into random chunks, or single characters.
+    """
+    if rand.random() < 0.3:
+        return list(document)
+    cuts = sorted(rand.sample(range(len(document) + 1),
+        min(len(document) + 1, rand.randint(0, 12))))
+    return [document[start:end] for start, end
+        in zip([0] + cuts, cuts + [len(document)])]
+
+def documents(rand, count):
+    """Yield count random documents in chunks.
+    """
+    for seed in range(3):
+        yield chunked(rand, html_document(100000, 500, 4, seed=seed))
+    for _ in range(count):
+        document = ''.join(rand.choice(PIECES)
+            for _ in range(rand.randint(0, rand.choice([40, 200]))))
+        yield chunked(rand, document)
+
+def main():
+    parser = argparse.ArgumentParser(description='check that HTML read '
+        'in chunks gives the same plaintext as read whole')
+    parser.add_argument('--documents', type=int, default=5000,
+        help='number of random documents')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rand = random.Random(args.seed)
+    checked = differ = differ_fast = 0
+    known = KNOWN + [[html] for html in HTML_FAST_CHECKS]
+    for chunks in known + list(documents(rand, args.documents)):
+        checked += 1
+        whole = html_to_text(''.join(chunks))
+        streamed = ''.join(iter_html_to_text(chunks))
+        if streamed != whole:
+            differ += 1
+            if differ <= 5:
+                print("Different in chunks: {!r}".format(chunks)[:500])
+                print("  whole:  {!r}".format(whole)[:300])
+                print("  chunks: {!r}".format(streamed)[:300])
+        for pieces in (chunks, [''.join(chunks)]):
+            parser = read(HTMLClean, pieces)
+            fast = read(HTMLFast, pieces)
+            if fast != parser:
+                differ_fast += 1
+                if differ_fast <= 5:
+                    print("Different with HTMLFast: {!r}".format(
+                        pieces)[:500])
+                    print("  HTMLClean: {!r}".format(parser)[:300])
+                    print("  HTMLFast:  {!r}".format(fast)[:300])
+    for begin, contain, chunks in BEGIN:
+        checked += 1
+        converter = Converter(begin=begin, contain=contain)
+        whole = converter.html_to_text(''.join(chunks))
+        streamed = ''.join(converter.iter_html_to_text(iter(chunks)))
+        if streamed != whole:
+            differ += 1
+            print("Different in chunks from {!r}: {!r}".format(begin,
+                chunks)[:500])
+            print("  whole:  {!r}".format(whole)[:300])
+            print("  chunks: {!r}".format(streamed)[:300])
+    print("{} documents checked, {} different in chunks, {} different "
+        "with HTMLFast (Python {}).".format(checked, differ, differ_fast,
+        sys.version.split()[0]))
+    if differ > 0 or differ_fast > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
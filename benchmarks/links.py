@@ -0,0 +1,52 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Benchmark HTML to plaintext conversion of link-heavy documents.
+
+Converts synthetic HTML documents with an increasing number of
+hyperlinks and prints the time taken per document and per link,
+which stays flat as long as closing a link does not depend on
+the size of the document.
+
+Usage:
+python3 benchmarks/links.py [--links 10000] [--repeat 3]
+'''
+
+from __future__ import unicode_literals
+import os
+import sys
+import argparse
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plaintextref import html_to_text
+
+def links_document(links):
+    """Create an HTML document containing the given number of links.
+    """
+    paragraphs = []
+    for no in range(links):
+        paragraphs.append('<p>Paragraph {0} with <a href="https://example.com/{1}">'
+            'link number {0}</a> and some text.</p>\n'.format(no, no % 500))
+    return '<html><body>\n' + ''.join(paragraphs) + '</body></html>\n'
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark link handling')
+    parser.add_argument('--links', type=int, default=10000,
+        help='number of links in the largest document')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='number of runs per document, the fastest one is reported')
+    args = parser.parse_args()
+
+    print("{:>8} {:>10} {:>12}".format("links", "seconds", "us/link"))
+    sizes = [args.links // 8, args.links // 4, args.links // 2, args.links]
+    for links in sizes:
+        html = links_document(links)
+        seconds = min(timeit.repeat(lambda: html_to_text(html),
+            number=1, repeat=args.repeat))
+        print("{:>8} {:>10.3f} {:>12.2f}".format(links, seconds,
+            seconds / links * 1000000))
+
+if __name__ == "__main__":
+    main()
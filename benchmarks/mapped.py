@@ -0,0 +1,81 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Benchmark converting plain text files byte by byte.
+
+Generates text documents with a decreasing share of lines containing
+brackets (see corpus.py), writes them to a temporary file and converts
+each one reading it line by line as text (Converter.old_refs and
+convert_lines) and memory-mapped (Converter.convert_mapped), checking
+that both give the same output. Prints the CPU time for both.
+
+Usage:
+python3 benchmarks/mapped.py [--size 20000000]
+'''
+
+from __future__ import unicode_literals
+import io
+import os
+import sys
+import argparse
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from plaintextref import Converter, map_text_file
+from corpus import text_document
+
+def convert_lines(path):
+    """Convert the file reading it line by line as text.
+    """
+    converter = Converter()
+    with io.open(path, 'r', encoding='utf-8') as f:
+        converter.old_refs(f)
+        f.seek(0)
+        return ''.join(converter.convert_lines(f)).encode('utf-8')
+
+def convert_mapped(path):
+    """Convert the memory-mapped file.
+    """
+    converter = Converter()
+    with io.open(path, 'r', encoding='utf-8') as f:
+        data = map_text_file(f)
+        try:
+            return b''.join(converter.convert_mapped(data))
+        finally:
+            data.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark converting '
+        'plain text files byte by byte')
+    parser.add_argument('--size', type=int, default=20000000,
+        help='approximate size of the documents in characters')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    os.close(fd)
+    try:
+        print("{:>8} {:>12} {:>12} {:>8}".format('density', 'lines',
+            'mapped', 'speedup'))
+        for density in (0.3, 0.05, 0.01, 0.001, 0):
+            with io.open(path, 'w', encoding='utf-8') as f:
+                f.write(text_document(args.size, density=density, asides=0,
+                    appendix=10))
+            times = []
+            outputs = []
+            for convert in (convert_lines, convert_mapped):
+                start = time.process_time()
+                outputs.append(convert(path))
+                times.append(time.process_time() - start)
+            if outputs[0] != outputs[1]:
+                sys.exit("Outputs differ for density {}.".format(density))
+            print("{:>8} {:>11.3f}s {:>11.3f}s {:>7.1f}x".format(density,
+                times[0], times[1], times[0] / times[1]))
+    finally:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Benchmark the reference substitution loop.
+
+Converts a corpus made of a text file repeated many times, once with
+a copy of the original loop (the pattern compiled on the fly for every
+line, every match taken apart and round brackets checked with urlparse
+like the original inspect_brackets did, without its status messages),
+once with Converter.convert_lines and, with --jobs, once with
+Converter.convert_lines_parallel, and prints lines per second for each.
+
+Usage:
+python3 benchmarks/references.py [--file thth.txt] [--repeat 20000] [--jobs 4]
+'''
+
+from __future__ import unicode_literals
+import os
+import re
+import sys
+import argparse
+import timeit
+import concurrent.futures
+from collections import OrderedDict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from urllib.parse import urlparse
+from plaintextref import Converter, REFERENCE_PATTERN
+
+class OriginalLoop(object):
+    """The reference substitution of the original script.
+    """
+    def __init__(self):
+        self.references = OrderedDict()
+        self.oldreferences = OrderedDict()
+        self.duplicate_ref = []
+        self.counter = 0
+
+    def inspect_brackets(self, matchobj):
+        fullref = matchobj.group(0)
+        brkts_rd_content = matchobj.group('rd')
+        brkts_sq_content = matchobj.group('sq')
+        brkts_sq_digit = matchobj.group('sq_d')
+        brkts_rd_spacemissing = matchobj.group('rd_word')
+        brkts_sq_spacemissing = matchobj.group('sq_word')
+        brkts_sq_d_spacemissing = matchobj.group('sq_d_word')
+        brkts_sq_quote = matchobj.group('sq_qu_quotes')
+        brkts_sq_quopen = matchobj.group('sq_qu_open')
+        brkts_sq_quclose = matchobj.group('sq_qu_close')
+
+        if brkts_sq_quopen is not None:
+            brkts_sq_quopen = "\""
+        if brkts_sq_quclose is not None:
+            brkts_sq_quclose = "\""
+        if brkts_rd_spacemissing is not None and brkts_rd_spacemissing != '':
+            brkts_append = ' ' + brkts_rd_spacemissing
+        elif brkts_sq_spacemissing is not None and brkts_sq_spacemissing != '':
+            brkts_append = ' ' + brkts_sq_spacemissing
+        elif brkts_sq_d_spacemissing is not None and brkts_sq_d_spacemissing != '':
+            brkts_append = ' ' + brkts_sq_d_spacemissing
+        else:
+            brkts_append = ''
+
+        if brkts_sq_digit is not None:
+            for ref, no in self.oldreferences.items():
+                if brkts_sq_digit == no:
+                    brkts_sq_content = ref
+                    break
+
+        if brkts_rd_content is not None:
+            url = urlparse(brkts_rd_content)
+            if url.scheme != '' and url.netloc != '':
+                if brkts_rd_content in self.references:
+                    refno = self.references[brkts_rd_content]
+                else:
+                    self.counter += 1
+                    refno = self.counter
+                    self.references[brkts_rd_content] = refno
+                return "[" + str(refno) + "]" + brkts_append
+            else:
+                return fullref
+        elif brkts_sq_quote is not None:
+            return brkts_sq_quopen + brkts_sq_quote + brkts_sq_quclose
+        elif brkts_sq_content is not None:
+            if brkts_sq_content in self.references:
+                refno = self.references[brkts_sq_content]
+                if (brkts_sq_content not in self.duplicate_ref
+                        and brkts_sq_digit is None):
+                    self.duplicate_ref.append(brkts_sq_content)
+            else:
+                self.counter += 1
+                refno = self.counter
+                self.references[brkts_sq_content] = refno
+            return "[" + str(refno) + "]" + brkts_append
+        else:
+            if brkts_sq_digit is not None and brkts_sq_content is None:
+                return ''
+            return fullref
+
+def substitute_all(lines):
+    """Run the pattern over every line like the original loop.
+    """
+    loop = OriginalLoop()
+    for line in lines:
+        if line != '--\n':
+            re.sub(REFERENCE_PATTERN, loop.inspect_brackets, line)
+
+def convert_lines(lines):
+    """Run the substitution loop of Converter.
+    """
+    converter = Converter()
+    for line in converter.convert_lines(lines):
+        pass
+
+def convert_lines_parallel(lines, pool):
+    """Run the parallel substitution of Converter.
+    """
+    converter = Converter()
+    for line in converter.convert_lines_parallel(lines, pool):
+        pass
+
+def report(name, loop, count):
+    """Time the fastest of five runs of loop over count lines
+    and print it.
+    """
+    seconds = min(timeit.repeat(loop, number=1, repeat=5))
+    print("{:<16} {:>8.3f}s {:>12.0f} lines/s".format(name,
+        seconds, count / seconds))
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark the reference '
+        'substitution loop')
+    parser.add_argument('--file', default=os.path.join(ROOT, 'thth.txt'),
+        help='text file to build the corpus from')
+    parser.add_argument('--repeat', type=int, default=20000,
+        help='number of times the file is repeated')
+    parser.add_argument('--jobs', type=int,
+        help='also search for references on this many worker processes')
+    args = parser.parse_args()
+
+    with open(args.file, encoding='utf-8') as f:
+        lines = f.read().splitlines(True) * args.repeat
+    print("{} lines".format(len(lines)))
+    loops = [(substitute_all.__name__, lambda: substitute_all(lines)),
+        (convert_lines.__name__, lambda: convert_lines(lines))]
+    for name, loop in loops:
+        report(name, loop, len(lines))
+    if args.jobs:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=args.jobs) as pool:
+            report("parallel ({})".format(args.jobs),
+                lambda: convert_lines_parallel(lines, pool), len(lines))
+
+if __name__ == "__main__":
+    main()
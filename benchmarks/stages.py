@@ -0,0 +1,180 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Benchmark the stages of the conversion pipeline.
+
+Generates a text and an HTML document (see corpus.py) and times each
+stage of their conversion on its own: HTMLClean.feed (and HTMLFast.feed
+for comparison) and concatenate for HTML, then old_refs, the substitution loop and write_appendix.
+Reports time, throughput and peak memory (measured with tracemalloc
+in a separate run, as tracing slows down the code) per stage as JSON.
+
+Usage:
+python3 benchmarks/stages.py [--size 2000000] [--links 10000] [--appendix 500]
+python3 benchmarks/stages.py --compare previous.json
+'''
+
+from __future__ import unicode_literals
+import io
+import os
+import sys
+import json
+import argparse
+import platform
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from plaintextref import Converter, HTMLClean, HTMLFast
+from corpus import text_document, html_document
+
+def html_stages(html):
+    """Return the stages of converting html to plaintext
+    as (name, function, input) tuples.
+    """
+    def feed(html, backend=HTMLClean):
+        content = backend()
+        content.feed(html)
+        return content
+
+    content = feed(html)
+    return [('HTMLClean.feed', feed, html),
+        ('HTMLFast.feed', lambda html: feed(html, HTMLFast), html),
+        ('HTMLClean.concatenate', lambda content: content.concatenate(), content)]
+
+def reference_stages(text):
+    """Return the stages of converting the references in text
+    as (name, function, input) tuples.
+    """
+    lines = text.splitlines(True)
+
+    def old_refs(lines):
+        converter = Converter()
+        converter.old_refs(lines)
+        return converter
+
+    def substitution(lines):
+        converter = old_refs(lines)
+        return converter, list(converter.substitute_lines(lines))
+
+    def write_appendix(converter):
+        fout = io.StringIO()
+        converter.write_appendix(fout)
+        return fout
+
+    converter, lines_out = substitution(lines)
+    return [('old_refs', old_refs, lines),
+        ('substitution', lambda lines: substitution(lines)[1], lines),
+        ('write_appendix', write_appendix, converter)]
+
+def size(value):
+    """Return the size in characters of a stage's input or output.
+    """
+    if isinstance(value, list):
+        return sum(len(item) for item in value)
+    if isinstance(value, HTMLClean):
+        return sum(len(item) for item in value.result)
+    if isinstance(value, Converter):
+        return sum(len(ref) for ref in value.references)
+    if isinstance(value, tuple):
+        return size(value[-1])
+    if isinstance(value, io.StringIO):
+        return len(value.getvalue())
+    return len(value)
+
+def measure(stages, repeat):
+    """Time each stage and measure its peak memory.
+    """
+    results = {}
+    for name, function, value in stages:
+        seconds = min(timeit.repeat(lambda: function(value), number=1,
+            repeat=repeat))
+        tracemalloc.start()
+        output = function(value)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        chars = size(value)
+        # old_refs only reads its input
+        if name == 'old_refs':
+            chars_out = 0
+        else:
+            chars_out = size(output)
+        results[name] = {
+            'seconds': round(seconds, 6),
+            'chars_in': chars,
+            'chars_out': chars_out,
+            'mchars_per_second': round(chars / seconds / 1000000, 3) if seconds else None,
+            'peak_memory_kb': peak // 1024,
+        }
+    return results
+
+def compare(results, previous):
+    """Print how much slower (+) or faster (-) each stage got.
+    """
+    for document in results['documents']:
+        for name, stage in results['documents'][document].items():
+            try:
+                before = previous['documents'][document][name]['seconds']
+            except KeyError:
+                continue
+            change = (stage['seconds'] - before) / before * 100
+            print("{:<6} {:<22} {:>+7.1f}%".format(document, name, change),
+                file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark the stages '
+        'of the conversion pipeline')
+    parser.add_argument('--size', type=int, default=2000000,
+        help='approximate size of the documents in characters')
+    parser.add_argument('--density', type=float, default=0.3,
+        help='probability of a sentence containing a reference')
+    parser.add_argument('--url-share', dest='url_share', type=float, default=0.5,
+        help='share of URLs among references')
+    parser.add_argument('--refs', type=int, default=1000,
+        help='number of different references in the text document')
+    parser.add_argument('--appendix', type=int, default=500,
+        help='size of the old appendix of the text document')
+    parser.add_argument('--links', type=int, default=10000,
+        help='number of hyperlinks in the HTML document')
+    parser.add_argument('--depth', type=int, default=4,
+        help='nesting depth of div elements in the HTML document')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='number of runs per stage, the fastest one is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default='-',
+        help='file to write the JSON report to (default: stdout)')
+    parser.add_argument('--compare', metavar='JSON',
+        help='earlier report to compare the stage times with')
+    args = parser.parse_args()
+
+    text = text_document(args.size, args.density, args.url_share, args.refs,
+        appendix=args.appendix, seed=args.seed)
+    html = html_document(args.size, args.links, args.depth, seed=args.seed)
+    html_text = HTMLClean()
+    html_text.feed(html)
+    html_text = html_text.concatenate()
+
+    results = {
+        'python': platform.python_version(),
+        'parameters': dict(vars(args)),
+        'documents': {
+            'text': measure(reference_stages(text), args.repeat),
+            'html': dict(measure(html_stages(html), args.repeat),
+                **measure(reference_stages(html_text), args.repeat)),
+        },
+    }
+    del results['parameters']['output']
+    report = json.dumps(results, indent=2, sort_keys=True)
+    if args.output == '-':
+        print(report)
+    else:
+        with io.open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report + '\n')
+    if args.compare:
+        with io.open(args.compare, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Benchmark the startup time of the command line interface.
+
+Converts a small text document (see corpus.py) with a new Python
+process at a time, the way a per-message hook does, and reports the
+time taken on top of starting Python itself. Runs it again with
+python -X importtime to list the modules imported and their import
+times, keeping the shortest time of each module over all runs.
+Exits with status 1 if modules only needed for other inputs (HTML,
+Markdown, caching, several files, the server) are imported, or if
+the time spent importing the modules Python itself does not import
+exceeds the budget. Unlike wall times this barely changes between
+runs, so the budget is a tight one relative to the time Python spends
+importing its own modules unless given in milliseconds.
+
+Usage:
+python3 benchmarks/startup.py [--runs 20] [--budget MS]
+'''
+
+from __future__ import unicode_literals
+import io
+import os
+import sys
+import argparse
+import subprocess
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from corpus import text_document
+
+SCRIPT = os.path.join(ROOT, 'plaintextref.py')
+# modules which converting a text file should not import
+FORBIDDEN = ('html.parser', 'html.entities', 'concurrent.futures',
+    'tempfile', 'hashlib', 'json', 'glob', 'asyncio', 'textref.htmltext',
+    'textref.markdowntext', 'textref.server')
+# default budget for importing the modules of a text conversion, as a
+# multiple of the time Python spends importing its own modules at startup
+# (about 3.2 times)
+BUDGET_FACTOR = 3.5
+# write bytecode caches, so modules are not compiled again on every run
+ENVIRONMENT = dict((name, value) for name, value in os.environ.items()
+    if name != 'PYTHONDONTWRITEBYTECODE')
+
+def run_time(command, runs):
+    """Return the shortest wall time of running command runs times.
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call(command, stdout=subprocess.DEVNULL,
+            env=ENVIRONMENT)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def import_times(command, runs=1):
+    """Run command runs times with -X importtime and return the modules
+    imported as a dictionary mapping their names to the shortest self
+    time of the module in seconds.
+    """
+    modules = {}
+    for _ in range(runs):
+        result = subprocess.run(command[:1] + ['-X', 'importtime']
+            + command[1:], stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE, universal_newlines=True, check=True,
+            env=ENVIRONMENT)
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            own, cumulative, name = line[len('import time:'):].split('|')
+            name = name.strip()
+            modules[name] = min(modules.get(name, 1), int(own) / 1000000)
+    return modules
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark the startup '
+        'time of the command line interface')
+    parser.add_argument('--runs', type=int, default=20,
+        help='number of runs, the fastest one is reported')
+    parser.add_argument('--budget', type=float,
+        help='milliseconds importing the modules of the conversion may '
+        'take (default: {} times the time Python takes to import its own '
+        'modules)'.format(BUDGET_FACTOR))
+    parser.add_argument('--top', type=int, default=10,
+        help='number of slowest imports to list')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'message.txt')
+    with io.open(path, 'w', encoding='utf-8') as f:
+        f.write(text_document(2000, seed=1))
+    command = [sys.executable, SCRIPT, path, '-p', directory]
+    try:
+        python = run_time([sys.executable, '-c', 'pass'], args.runs)
+        total = run_time(command, args.runs)
+        baseline = import_times([sys.executable, '-c', 'pass'], args.runs)
+        modules = dict((name, own) for name, own
+            in import_times(command, args.runs).items()
+            if name not in baseline)
+    finally:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+    imports = sum(modules.values()) * 1000
+    budget = args.budget
+    if budget is None:
+        budget = sum(baseline.values()) * 1000 * BUDGET_FACTOR
+    print("python: {:.1f} ms, plaintextref: {:.1f} ms (+{:.1f} ms)".format(
+        python * 1000, total * 1000, (total - python) * 1000))
+    print("{} modules imported, {:.1f} ms (budget {:.1f} ms)".format(
+        len(modules), imports, budget))
+    for name, own in sorted(modules.items(), key=lambda module: module[1],
+            reverse=True)[:args.top]:
+        print("{:>8.2f} ms  {}".format(own * 1000, name))
+
+    failed = False
+    forbidden = sorted(name for name in modules if name in FORBIDDEN)
+    if len(forbidden) > 0:
+        print("Imported for a text file: {}".format(', '.join(forbidden)))
+        failed = True
+    if imports > budget:
+        print("Import time exceeds the budget.")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
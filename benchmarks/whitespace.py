@@ -0,0 +1,89 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Check and benchmark the whitespace normalization of HTML conversion.
+
+normalize_whitespace changes whitespace in a single pass. This script
+compares its output to the seven regular expressions it replaces,
+for the example files and random strings, and times both.
+
+Usage:
+python3 benchmarks/whitespace.py [--strings 100000] [--size 4000000]
+'''
+
+from __future__ import unicode_literals
+import os
+import re
+import sys
+import random
+import argparse
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from plaintextref import HTMLClean, convert_text, normalize_whitespace
+
+def normalize_reference(fulltext):
+    """Remove whitespace like HTMLClean.concatenate used to.
+    """
+    fulltext = re.sub('(\\w)[ \t]*\n[ \t]*(\\w)', r'\1 \2', fulltext)
+    fulltext = re.sub('(\\S)([ \t]*\n[ \t]+|[ \t]*\n[ \t]+)(\\S)', r'\1 \3', fulltext)
+    fulltext = re.sub('([ \t]*\n[ \t]+|[ \t]*\n[ \t]+)', ' ', fulltext)
+    fulltext = re.sub('([ \t]*\n\n[ \t]+|[ \t]*\n\n[ \t]+)', '\n\n', fulltext)
+    fulltext = re.sub('([\t ]*\n[\n \t]+)', '\n\n', fulltext)
+    fulltext = re.sub('[ \t]+', ' ', fulltext)
+    fulltext = re.sub('([\n]{2,})', '\n\n', fulltext)
+    return fulltext
+
+def random_strings(count, seed=0):
+    """Yield random strings of whitespace and (non-)word characters.
+    """
+    rand = random.Random(seed)
+    text = ['a', 'bc', '_', '1', '\xe9', '\xb2', '\xa0', '\r', ',', '-', '\x0c']
+    whitespace = [' ', '\t', '\n']
+    for _ in range(count):
+        yield ''.join(rand.choice(text) if rand.random() < 0.4
+            else rand.choice(whitespace) for _ in range(rand.randint(0, 30)))
+
+def html_text(size):
+    """Return unnormalized text of the HTML example of at least size characters.
+    """
+    with open(os.path.join(ROOT, 'htmlexample.html'), encoding='utf-8') as f:
+        html = f.read()
+    content = HTMLClean()
+    content.feed(html * (size // len(html) + 1))
+    return u''.join(content.result).strip()
+
+def main():
+    parser = argparse.ArgumentParser(description='check and benchmark '
+        'whitespace normalization')
+    parser.add_argument('--strings', type=int, default=100000,
+        help='number of random strings to compare')
+    parser.add_argument('--size', type=int, default=4000000,
+        help='size of the text to time normalization with')
+    args = parser.parse_args()
+
+    with open(os.path.join(ROOT, 'htmlexample.html'), encoding='utf-8') as f:
+        output, references = convert_text(f.read(),
+            {'html': True, 'begin': '<body>'})
+    with open(os.path.join(ROOT, 'htmlexample_plaintext.html'), encoding='utf-8') as f:
+        if output != f.read():
+            sys.exit("htmlexample.html: output differs from htmlexample_plaintext.html")
+    print("htmlexample.html: same output")
+
+    for text in random_strings(args.strings):
+        if normalize_whitespace(text) != normalize_reference(text):
+            sys.exit("random strings: output differs for {!r}".format(text))
+    print("{} random strings: same output".format(args.strings))
+
+    text = html_text(args.size)
+    if normalize_whitespace(text) != normalize_reference(text):
+        sys.exit("HTML example text: output differs")
+    for normalize in (normalize_reference, normalize_whitespace):
+        seconds = min(timeit.repeat(lambda: normalize(text), number=1, repeat=3))
+        print("{:<22} {:>8.3f}s {:>8.1f} MB/s".format(normalize.__name__, seconds,
+            len(text) / seconds / 1000000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+'''
+Convert in-text references to sequentially numbered footnotes and
+change text-based files (like HTML) to proper plaintext in the process.
+
+Copyright (c) 2015 K Kollmann <code∆k.kollmann·moe>
+License: http://opensource.org/licenses/MIT The MIT License (MIT)
+
+The program is run as plaintextref.py, which also gives the whole
+API; the modules are:
+
+core: finding and numbering references in plain text (Converter)
+htmltext: changing HTML to plaintext
+markdowntext: changing Markdown to plaintext
+server: converting many documents concurrently or on a Unix socket
+cli: the command line interface
+'''
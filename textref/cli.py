@@ -0,0 +1,588 @@
+# -*- coding: utf-8 -*-
+
+'''
+Command line interface: convert files, directories and glob patterns,
+read from stdin or run as a server (see plaintextref.py -h).
+'''
+
+# Python2
+from __future__ import unicode_literals
+import io
+import sys
+import os
+import errno
+import contextlib
+
+try:
+    # Python2
+    from io import open
+except ImportError:
+    # Python3
+    pass
+
+from textref.core import (timer, Converter, Profile, ResultCache,
+    ParagraphIndex, map_text_file, iter_lines, show_brackets, text_size,
+    write_output, CHUNK_SIZE, CACHE_SIZE, BATCH_EXTENSIONS)
+
+def newfilepath(**allpaths):
+    """Check writability of the path provided for output file.
+    """
+    for key in allpaths:
+        # append missing '/' to paths
+        try:
+            if allpaths[key] != "" and allpaths[key][-1:] != '/':
+                allpaths[key] += '/'
+        except:
+            allpaths[key] = ''
+        # replace leading ~ with HOME directory in paths input as string
+        if allpaths[key].find("~") != -1:
+            allpaths[key] = os.path.expanduser(allpaths[key])
+    try:
+        oldpath = allpaths['oldpath']
+        argpath = allpaths['argpath']
+        cwd = allpaths['cwd']
+    except:
+        sys.exit("Argument missing. Please check your program code.")
+
+    if argpath != '':
+        newpath = ""
+    else:
+        newpath = oldpath
+
+    # check pathnames for writability
+    while newpath == "":
+        if argpath == oldpath:
+            newpath = oldpath
+            continue # continue at else statement in while-else
+        else:
+            if os.access(argpath, os.W_OK) == True:
+                newpath = argpath
+                break # main program starts running here
+            else:
+                print("The specified path is not a writable directory.\n"
+                    "Trying to save to the directory containing "
+                    "the original file.") # status msg
+                newpath = oldpath
+                continue # continue as else statement in while-else
+    else:
+        if os.access(newpath, os.W_OK) == True:
+            pass # main program starts running here
+        else:
+            if newpath == cwd:
+                sys.exit("The directory containing the original file/\n"
+                            "the current working directory is not writable.\n"
+                            "Exiting.")
+            else:
+                print("The directory containing the original file "
+                        "is not writable.") # status msg
+                if argpath == oldpath or argpath == cwd:
+                    sys.exit("Exiting.")
+                else:
+                    print("Trying to save to the current "
+                            "working directory.") # status msg
+                    newpath = cwd
+                    if os.access(newpath, os.W_OK) == True:
+                        print("writable?")
+                        pass # main program starts running here
+                    else:
+                        sys.exit("The current working directory is not writable.\n"
+                                    "Exiting.")
+    return newpath
+
+def build_parser():
+    """Build the parser for any command line arguments received.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(
+            formatter_class=argparse.RawTextHelpFormatter,
+            description = '''---------------
+%(prog)s is a program to change text-based files (like HTML)
+to proper plaintext and to convert any references (like URLs or citations)
+to sequentially numbered footnotes which are appended to the file.
+
+References used for footnotes are URLs enclosed in round brackets
+as well as any other text enclosed in square brackets.
+Regular text in round brackets, if not preceded by a URL, is ignored.
+
+See https://github.com/kerstin/plaintextref for a more detailed description.
+---------------
+''')
+    parser.add_argument("filenames", metavar="filename", nargs="*",
+        help='''name of (path to) the file you want to convert;
+supported file types are: .txt, .html/.htm, .md;
+several files, directories or glob patterns (like "mail/*.html")
+are converted in parallel (see -j);
+use - to read from stdin and write to stdout''')
+    parser.add_argument('-b','--begin', dest="begin", metavar="\"TEXT\"",
+        help = '''define where to begin scanning an HTML file
+e.g. --begin \"<body>\",
+e.g. --b \"2 February 2015\"''')
+    parser.add_argument('-c','--contain', dest="contain", action="store_true",
+        help = '''run argument -b containing the text provided;
+by default, parsing begins only after the given string''')
+    # parser.add_argument('-i','--images', dest="images", action="store_true",
+    #     help = '''treat image files in <a></a> tags as part of the link description;
+    # default is to strip <img> tags from converted HTML files''')
+    parser.add_argument('-a','--append', dest="suffix", metavar="SUFFIX",
+        default="_plaintext",
+        help = '''the suffix to append to the filename of the output file;
+defaults to _plaintext being added to the original filename''')
+    parser.add_argument('-s','--save', dest="newname", metavar="FILENAME",
+        help = '''the name to save the new file under if you do not want to
+simply append a suffix to the original filename (see -a);
+the file extension of the original file gets added in any case
+''')
+    parser.add_argument('-p','--path', dest="path",
+        help = '''path to save the converted file to if you do not want to
+save it in the same directory as the original file
+''')
+    # NOTE: looking for old appendix is now default
+    # parser.add_argument('-r','--re-index', dest="reindex", action="store_true",
+    #     default="reindex",
+    #     help = '''if there are already footnotes and an appendix present,
+    # renumber existing references and incorporate them
+    # into a new appendix including both old and new references''')
+    parser.add_argument('-n','--noref', dest="noref", action="store_true",
+        help = '''convert the file to plaintext, but don't create an appendix;
+useful if you just want to strip HTML tags or Markdown links''')
+    parser.add_argument('-u','--normalize-urls', dest="normalize_urls",
+        action="store_true",
+        help = '''use one footnote for different forms of the same URL,
+e.g. HTTP://Example.com:80 and http://example.com/''')
+    parser.add_argument('-S','--stream', dest="stream", action="store_true",
+        help = '''convert the file in a single pass, writing lines as they
+are converted; use for files of any size (no 2MB limit); the
+output is the same''')
+    parser.add_argument('-A','--atomic', dest="atomic", action="store_true",
+        help = '''write the output file to a temporary file first and rename it
+when done, so a failed run never leaves a half-written output file''')
+    parser.add_argument('-P','--parallel', dest="parallel", action="store_true",
+        help = '''search a single large file for references in chunks on
+several worker processes (see -j); the output is the same;
+no 2MB limit''')
+    parser.add_argument('-I','--incremental', dest="incremental",
+        action="store_true",
+        help = '''only search the paragraphs changed since the last run for
+references, keeping an index of them next to the output file
+(OUTPUT.paragraphs.json); the output is the same''')
+    parser.add_argument('--reference-index', dest="reference_index",
+        action="store_true",
+        help = '''also write the references as JSON Lines next to the output
+file (OUTPUT.references.jsonl): number, reference, whether it
+is a URL, line and offset of its first footnote in the output
+and number of footnotes''')
+    parser.add_argument('-j','--jobs', dest="jobs", type=int, metavar="N",
+        help = '''number of worker processes when converting several files
+or a file in parallel (see -P); defaults to the number of CPUs''')
+    parser.add_argument('-f','--format', dest="format", choices=['txt', 'html', 'md'],
+        default='txt',
+        help = '''file type of documents read from stdin or a socket (see --serve);
+defaults to txt''')
+    # names of HTML_BACKENDS (textref.htmltext is not imported before
+    # it is needed)
+    parser.add_argument('--html-backend', dest="html_backend",
+        choices=['fast', 'htmlparser'], default='htmlparser',
+        help = '''how to read HTML files: with html.parser, or with a faster
+reader giving the same result (fast); HTML read in chunks
+(-S, stdin) is always read with html.parser (default: %(default)s)''')
+    parser.add_argument('--serve', dest="serve", metavar="SOCKET",
+        help = '''run as a server converting documents sent to the Unix socket
+SOCKET (each one preceded by its length as 4 bytes, big-endian)
+''')
+    parser.add_argument('--cache', dest="cache", metavar="DIR",
+        help = '''keep converted documents in the directory DIR and reuse them
+for documents converted again with the same options''')
+    parser.add_argument('--cache-size', dest="cache_size", type=int,
+        metavar="MB", default=CACHE_SIZE // (1024 * 1024),
+        help = '''size limit of the cache in megabytes; the least recently
+used documents are removed first (default: %(default)s)''')
+    parser.add_argument('--profile', dest="profile", metavar="FILE",
+        nargs='?', const='-',
+        help = '''record time, calls, bytes in and out per stage and matches
+per kind of bracket; print them to stderr, or write them
+to FILE as JSON''')
+    return parser
+
+def output_filename(fullpath, args, verbose=True):
+    """Build the name of the output file for the file at fullpath
+    from the path, suffix and name given on the command line.
+    Return it together with the file extension.
+    """
+    # add default suffix for output files
+    suffix = "_plaintext"
+    filepath, filename = os.path.split(fullpath)
+
+    newpath = newfilepath(oldpath=filepath, cwd=os.getcwd(), argpath=args.path)
+
+    fileroot, extension = os.path.splitext(filename)
+    # check for file root and extension
+    if extension == '':
+        if verbose:
+            print("::: Attn: the provided file has no file extension.") # status msg
+        separator = ''
+    else:
+        separator = "."
+        extsplit = extension.split(separator)
+        extension = extsplit[-1]
+
+    #check for new filename and suffix
+    if args.suffix != "":
+        suffix = args.suffix
+    if args.newname is not None and args.newname != "":
+        fileroot = args.newname
+        suffix = ''
+    filename_out = newpath + fileroot + suffix + separator + extension
+    return filename_out, extension
+
+def write_profile(profile, filename):
+    """Write the records of a profile to stderr as a table
+    (if filename is -) or to the file as JSON.
+    """
+    if filename == '-':
+        profile.write_table(sys.stderr)
+    else:
+        with open(filename, 'w', encoding='utf-8') as fout:
+            profile.write_json(fout)
+
+def convert_source(converter, f, args, status, pool=None, index=None):
+    """Convert the file f opened for reading with the options given
+    on the command line and return the resulting lines.
+    References are searched for on the process pool if given,
+    or only in the paragraphs not found in the ParagraphIndex index.
+    """
+    if converter.html:
+        status("Converting HTML to plaintext...") # status msg
+        if args.stream:
+            # read in html file chunk by chunk
+            # and split at user-provided tag or string if present
+            source = iter_lines(converter.iter_html_to_text(
+                iter(lambda: f.read(CHUNK_SIZE), '')))
+        else:
+            # read in html file as one string
+            # and split at user-provided tag or string if present
+            # into a list of lines (old_refs needs a second pass)
+            source = converter.html_to_text(f.read()).splitlines(True)
+    elif converter.markdown:
+        status("Converting Markdown to plaintext...") # status msg
+        source = converter.markdown_to_text(f)
+        if not args.stream:
+            # old_refs needs a second pass
+            source = list(source)
+    else:
+        source = f
+    # don't create any footnotes if --noref flag is set
+    # (only converts html or markdown to plaintext)
+    if (converter.html or converter.markdown) and args.noref:
+        lines_out = source
+    # actual conversion of refs
+    elif args.stream:
+        # find old appendix and new references in one pass
+        status("Looking for references...") # status msg
+        lines_out = converter.stream(source)
+    else:
+        # NOTE: looking for old appendix is now default
+        # find old appendix on -r, --re-index flag
+        # if (args.reindex):
+        status("Looking for existing appendix...") # status msg
+        converter.old_refs(source)
+        # needs seek for all proper files to 'reset' the source
+        # file to the beginning of the file!
+        # does not work for HTML files as these are lists of lines now
+        try:
+            source.seek(0,)
+        except:
+            pass
+        status("Looking for new references...") # status msg
+        # NOTE: looking for old appendix is now default
+        # else:
+        #     print("Looking for references...") # status msg
+        if pool is not None:
+            lines_out = converter.convert_lines_parallel(source, pool)
+        elif index is not None:
+            lines_out = converter.convert_lines_incremental(source, index)
+        else:
+            lines_out = converter.convert_lines(source)
+    if converter.markdown:
+        lines_out = map(show_brackets, lines_out)
+    return lines_out
+
+def convert_file(filename, args, verbose=True):
+    """Convert a single file with the options given on the command line
+    and return the name of the output file.
+    """
+    def status(msg):
+        if verbose:
+            print(msg)
+
+    fullpath = os.path.realpath(filename)
+    # validate provided filename
+    try:
+        f = open(fullpath, 'r')
+    except OSError as e:
+        # filename is a directory or invalid filename
+        if e.errno == errno.EISDIR or e.errno == errno.ENOENT:
+            sys.exit("You did not specify a valid file name.")
+        # no permission to read the file
+        elif e.errno == errno.EACCES:
+            sys.exit("The specified file cannot be read from.")
+        else:
+            print(e)
+    else:
+        f.close()
+
+    filename_out, extension = output_filename(fullpath, args, verbose)
+
+    profile = Profile() if args.profile else None
+    options = {'begin': args.begin, 'contain': args.contain,
+        'noref': args.noref, 'html': extension in ('htm', 'html'),
+        'normalize_urls': args.normalize_urls, 'markdown': extension == 'md',
+        'html_backend': args.html_backend}
+    converter = Converter(verbose=verbose, profile=profile,
+        index_references=args.reference_index, **options)
+    if args.cache:
+        cache = ResultCache(args.cache, args.cache_size * 1024 * 1024)
+    else:
+        cache = None
+
+    # convert plain text byte by byte where possible
+    mapped = None
+    if (not converter.html and not converter.markdown and profile is None
+            and not (args.stream or args.parallel or args.incremental)):
+        with open(fullpath, 'r', encoding='utf-8') as f:
+            mapped = map_text_file(f)
+
+    # only allow files up to 2MB in size unless streaming, converting
+    # in parallel or from a memory map (none of which read the whole
+    # document into memory)
+    if (mapped is not None or args.stream or args.parallel
+            or os.path.getsize(fullpath) <= 2000000):
+        start = timer()
+        with open(fullpath, 'r', encoding='utf-8') as f:
+            status("Reading input file...")
+            # look up the result of an earlier conversion
+            # (which does not include the reference index)
+            cached = None
+            if cache is not None:
+                with open(fullpath, 'rb') as fbin:
+                    key = cache.key(fbin, options)
+                if not args.reference_index:
+                    cached = cache.get(key)
+            if cached is not None:
+                status("Found in cache.") # status msg
+                if mapped is not None:
+                    mapped.close()
+                with cached:
+                    write_output(filename_out, cached, atomic=args.atomic)
+            elif args.parallel:
+                import concurrent.futures
+
+                with concurrent.futures.ProcessPoolExecutor(
+                        max_workers=args.jobs) as pool:
+                    lines_out = convert_source(converter, f, args, status, pool)
+                    write_output(filename_out, lines_out, atomic=args.atomic)
+            elif args.incremental:
+                index = ParagraphIndex(filename_out + '.paragraphs.json',
+                    options)
+                lines_out = convert_source(converter, f, args, status,
+                    index=index)
+                write_output(filename_out, lines_out, atomic=args.atomic)
+                index.save()
+            elif mapped is not None:
+                with contextlib.closing(mapped):
+                    status("Looking for existing appendix...") # status msg
+                    pieces = converter.convert_mapped(mapped)
+                    status("Looking for new references...") # status msg
+                    write_output(filename_out, pieces, atomic=args.atomic,
+                        binary=True)
+            else:
+                lines_out = convert_source(converter, f, args, status)
+                write_output(filename_out, lines_out, atomic=args.atomic)
+            if args.reference_index:
+                write_output(filename_out + '.references.jsonl',
+                    converter.reference_index(), atomic=args.atomic)
+            if cache is not None and cached is None:
+                cache.put_file(key, filename_out)
+        if profile is not None:
+            profile.record('total', start)
+            record = profile.stage('total')
+            record['bytes_in'] += os.path.getsize(fullpath)
+            record['bytes_out'] += os.path.getsize(filename_out)
+            profile.done('total')
+            write_profile(profile, args.profile)
+        status("DONE.") # status msg
+        status("The output file is: {}" .format(filename_out)) # status msg
+        return filename_out
+    else:
+        sys.exit("File size must be below 2MB.")
+
+def is_output_file(path, suffix):
+    """Check if the file at path is an earlier output file,
+    its name ending in suffix.
+    """
+    fileroot = os.path.splitext(os.path.basename(path))[0]
+    return suffix != '' and fileroot.endswith(suffix)
+
+def batch_files(paths, suffix):
+    """Expand the paths given on the command line to the files
+    to convert: directories to the supported files they contain,
+    glob patterns to the files matching them (both except for
+    earlier output files ending in suffix).
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                fullname = os.path.join(path, name)
+                extension = os.path.splitext(name)[1]
+                if (os.path.isfile(fullname) and extension in BATCH_EXTENSIONS
+                        and not is_output_file(fullname, suffix)):
+                    yield fullname
+        elif not os.path.exists(path):
+            import glob
+
+            fullnames = sorted(glob.glob(path))
+            # keep paths matching nothing to report them as invalid
+            if len(fullnames) == 0:
+                yield path
+            for fullname in fullnames:
+                if not is_output_file(fullname, suffix):
+                    yield fullname
+        else:
+            yield path
+
+def is_pattern(path):
+    """Check if path is a glob pattern matching any files.
+    """
+    import glob
+
+    return len(glob.glob(path)) > 0
+
+def convert_batch_file(filename, args):
+    """Convert one file of a batch in a worker process.
+    Return the file name, the output file name and an error message.
+    """
+    try:
+        return filename, convert_file(filename, args, verbose=False), None
+    except SystemExit as e:
+        return filename, None, str(e.code)
+    except Exception as e:
+        return filename, None, "{}: {}".format(type(e).__name__, e)
+
+def convert_batch(filenames, args):
+    """Convert several files on a pool of worker processes,
+    printing the result for each file and a summary.
+    Return the number of files which failed to convert.
+    """
+    import concurrent.futures
+
+    failed = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        jobs = [pool.submit(convert_batch_file, filename, args)
+            for filename in filenames]
+        for job in concurrent.futures.as_completed(jobs):
+            filename, filename_out, error = job.result()
+            if error is None:
+                print("OK     {} -> {}".format(filename, filename_out))
+            else:
+                failed += 1
+                print("FAILED {}: {}".format(filename, error))
+    print("{} of {} files converted, {} failed.".format(
+        len(filenames) - failed, len(filenames), failed)) # status msg
+    return failed
+
+def filter_stdin(args):
+    """Convert text or HTML read from stdin in a single pass and
+    write the result to stdout as it is converted.
+    """
+    profile = Profile() if args.profile else None
+    converter = Converter(begin=args.begin, contain=args.contain,
+        noref=args.noref, html=args.format == 'html',
+        normalize_urls=args.normalize_urls, markdown=args.format == 'md',
+        profile=profile)
+    start = timer()
+    stdin = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    if converter.html:
+        source = iter(lambda: stdin.read(CHUNK_SIZE), '')
+    else:
+        source = stdin
+    if profile is not None:
+        counted = {'bytes_in': 0, 'bytes_out': 0}
+        source = converter.profile_input(counted, source)
+    if converter.html:
+        source = iter_lines(converter.iter_html_to_text(source))
+    elif converter.markdown:
+        source = converter.markdown_to_text(source)
+    if (converter.html or converter.markdown) and converter.noref:
+        lines_out = source
+    else:
+        lines_out = converter.stream(source)
+    if converter.markdown:
+        lines_out = map(show_brackets, lines_out)
+    for line_out in lines_out:
+        stdout.write(line_out)
+        if profile is not None:
+            counted['bytes_out'] += text_size(line_out)
+    stdout.flush()
+    if profile is not None:
+        profile.record('total', start)
+        profile.stage('total').update(counted)
+        profile.done('total')
+        write_profile(profile, args.profile)
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    # run as a server or a filter
+    if args.profile and (args.serve or len(args.filenames) > 1
+            or any(os.path.isdir(name) for name in args.filenames)):
+        parser.error("--profile can only be used when converting a single file")
+    if args.parallel and (args.serve or args.filenames == ['-']):
+        parser.error("-P/--parallel can only be used when converting a file")
+    if args.parallel and args.stream:
+        parser.error("-P/--parallel cannot be used with -S/--stream")
+    if args.incremental and (args.serve or args.filenames == ['-']):
+        parser.error("-I/--incremental can only be used when converting files")
+    if args.incremental and (args.stream or args.parallel):
+        parser.error("-I/--incremental cannot be used with -S/--stream "
+            "or -P/--parallel")
+    if args.reference_index and (args.serve or args.filenames == ['-']):
+        parser.error("--reference-index can only be used when converting files")
+    if args.serve:
+        from textref.server import serve
+
+        if args.cache:
+            cache = ResultCache(args.cache, args.cache_size * 1024 * 1024)
+        else:
+            cache = None
+        serve(args.serve, {'begin': args.begin, 'contain': args.contain,
+            'noref': args.noref, 'html': args.format == 'html',
+            'normalize_urls': args.normalize_urls,
+            'markdown': args.format == 'md',
+            'html_backend': args.html_backend}, args.jobs, cache)
+        return
+    if len(args.filenames) == 0:
+        parser.error("the following arguments are required: filename")
+    if args.filenames == ['-']:
+        filter_stdin(args)
+        return
+
+    # convert a single file
+    if (len(args.filenames) == 1 and not os.path.isdir(args.filenames[0])
+            and (os.path.exists(args.filenames[0])
+                or not is_pattern(args.filenames[0]))):
+        convert_file(args.filenames[0], args)
+        return
+
+    # convert several files, directories or glob patterns
+    if args.newname is not None and args.newname != "":
+        parser.error("-s/--save cannot be used when converting several files")
+    if args.parallel:
+        parser.error("-P/--parallel cannot be used when converting several files")
+    filenames = list(batch_files(args.filenames, args.suffix))
+    if len(filenames) == 0:
+        sys.exit("No files to convert found.")
+    if convert_batch(filenames, args) > 0:
+        sys.exit(1)
+
@@ -0,0 +1,1508 @@
+# -*- coding: utf-8 -*-
+
+'''
+Find in-text references in plain text and convert them to sequentially
+numbered footnotes.
+
+Holds the Converter and everything a plain text file needs: the
+reference pattern, reading an old appendix, the result cache, the
+paragraph index of incremental conversions and profiling. HTML and
+Markdown are changed to plain text by textref.htmltext and
+textref.markdowntext, imported by the Converter when it first reads
+such a document.
+'''
+
+# Python2
+from __future__ import unicode_literals
+# Python3 + Python2
+# (modules only needed for some conversions, like urllib.parse and
+# tempfile, are imported where they are used to keep the startup time
+# for plain text files short)
+import io
+import os
+import re
+import errno
+import codecs
+import mmap
+from collections import OrderedDict
+
+try:
+    # Python2
+    from io import open
+except ImportError:
+    # Python3
+    pass
+try:
+    # Unix
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+try:
+    # Python3
+    from time import perf_counter as timer
+except ImportError:
+    # Python2
+    from time import time as timer
+
+# search lines and substitute text using regex:
+# find all round and square brackets
+# find square brackets within quotes
+REFERENCE_PATTERN = (""
+    "(?#check for round brackets)"
+    "([ ]*[\\(])(?P<rd>[^\\(\\)]*)([\\)])(?P<rd_word>\\w*)"
+    "|(?#check for square brackets inside quotation marks)"
+    "(?P<sq_qu_open>([“]|[\"]))(?P<sq_qu_quotes>([^\"“”[]*)([\\[])([^\"“”\\]]+)([\\]])([^“”\"]*))(?P<sq_qu_close>([”]|[\"]))"
+    "|(?#check for existing references)"
+    "([ ]*[\\[])(?P<sq_d>\\d+)([\\]])(?P<sq_d_word>\\w*)"
+    "|(?#check for square brackets)"
+    "([ ]*[\\[])(?P<sq>[^\\[\\]]*)([\\]])(?P<sq_word>\\w*)")
+REFERENCES = re.compile(REFERENCE_PATTERN)
+# characters which bracket content needs to contain for urlparse
+# to find both a scheme and a network location (urlparse removes tabs
+# and linebreaks before parsing)
+URL_SCHEME = re.compile(':[\t\r\n]*/[\t\r\n]*/')
+# existing references which can only be renumbered
+# once the old appendix has been read
+OLD_REFERENCE = re.compile('\\[\\d+\\]')
+# size up to which lines held back while streaming are kept in memory
+SPOOL_SIZE = 1024 * 1024
+# size of the chunks HTML files are read in while streaming
+CHUNK_SIZE = 64 * 1024
+# files converted when a directory is given on the command line
+BATCH_EXTENSIONS = ('.txt', '.htm', '.html', '.md')
+# lines of a document searched for references at once by a worker
+# process when converting in parallel
+CHUNK_LINES = 20000
+# largest document accepted by the server
+MAX_DOCUMENT_SIZE = 256 * 1024 * 1024
+# default size limit of the result cache (see --cache)
+CACHE_SIZE = 100 * 1024 * 1024
+# changes whenever the output for the same input and options may change,
+# invalidating results cached by earlier versions
+CACHE_VERSION = '2'
+# branches of REFERENCE_PATTERN counted when profiling
+BRANCHES = ('rd', 'sq', 'sq_qu', 'sq_d')
+# ports left out of normalized URLs
+DEFAULT_PORTS = {'http': '80', 'https': '443', 'ftp': '21'}
+PERCENT_ESCAPE = re.compile('%[0-9a-f]{2}', re.IGNORECASE)
+# results of is_url and normalize_url for recent URLs
+url_kinds = {}
+normalized_urls = {}
+
+def is_url(text):
+    """Check if text is a URL with both a scheme and a network
+    location, i.e. a URL that gets converted to a footnote.
+    """
+    try:
+        return url_kinds[text]
+    except KeyError:
+        pass
+    if URL_SCHEME.search(text) is None:
+        kind = False
+    else:
+        from urllib.parse import urlparse
+
+        try:
+            url = urlparse(text)
+        except ValueError:
+            # malformed, like an unclosed IPv6 address
+            kind = False
+        else:
+            kind = url.scheme != '' and url.netloc != ''
+    # keep the cache small, links tend to repeat within a document
+    if len(url_kinds) >= 4096:
+        url_kinds.clear()
+    url_kinds[text] = kind
+    return kind
+
+def normalize_url(text):
+    """Return the URL text in a normalized form to find different
+    forms of the same link: scheme and host in lower case, without
+    the default port, '/' as empty path and percent escapes in upper case.
+    Malformed URLs are returned as they are.
+    """
+    try:
+        return normalized_urls[text]
+    except KeyError:
+        pass
+    from urllib.parse import urlparse, urlunparse
+
+    try:
+        url = urlparse(text)
+    except ValueError:
+        return text
+    scheme = url.scheme.lower()
+    userinfo, at, hostport = url.netloc.rpartition('@')
+    host, colon, port = hostport.rpartition(':')
+    # no port given (or an IPv6 address without port)
+    if colon == '' or ']' in port:
+        host, port = hostport, ''
+    netloc = userinfo + at + host.lower()
+    if port != '' and port != DEFAULT_PORTS.get(scheme):
+        netloc += ':' + port
+    path = PERCENT_ESCAPE.sub(lambda m: m.group(0).upper(), url.path or '/')
+    query = PERCENT_ESCAPE.sub(lambda m: m.group(0).upper(), url.query)
+    normalized = urlunparse((scheme, netloc, path, url.params, query,
+        url.fragment))
+    if len(normalized_urls) >= 4096:
+        normalized_urls.clear()
+    normalized_urls[text] = normalized
+    return normalized
+
+def text_size(data):
+    """Return the size of a string or a list of strings
+    in bytes when encoded as UTF-8.
+    """
+    if isinstance(data, (list, tuple)):
+        return sum(len(item.encode('utf-8')) for item in data)
+    return len(data.encode('utf-8'))
+
+class Profile(object):
+    """Record wall time, number of calls and bytes in and out for each
+    stage of a conversion, and the number of matches per branch of
+    the reference pattern.
+
+    Stages are html.feed, html.concatenate (html.feed only when
+    streaming, as paragraphs are normalized while parsing), markdown,
+    old_refs, substitution, appendix and total. If callback is given, it is
+    called with the name and the record (a dictionary) of a stage
+    every time the stage finishes.
+    """
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.stages = OrderedDict()
+        self.matches = OrderedDict((branch, 0) for branch in BRANCHES)
+
+    def stage(self, name):
+        """Return the record of a stage, creating it on first use.
+        """
+        record = self.stages.get(name)
+        if record is None:
+            record = OrderedDict([('seconds', 0.0), ('calls', 0),
+                ('bytes_in', 0), ('bytes_out', 0)])
+            self.stages[name] = record
+        return record
+
+    def record(self, name, start, data_in=None, data_out=None):
+        """Add a call of a stage which started at start
+        (see timer) to its record.
+        """
+        seconds = timer() - start
+        record = self.stage(name)
+        record['seconds'] += seconds
+        record['calls'] += 1
+        if data_in is not None:
+            record['bytes_in'] += text_size(data_in)
+        if data_out is not None:
+            record['bytes_out'] += text_size(data_out)
+
+    def done(self, name):
+        """Mark a stage as finished.
+        """
+        if self.callback is not None:
+            self.callback(name, self.stage(name))
+
+    def iterate(self, name, items):
+        """Yield the items produced by a stage, recording the time
+        spent producing each one and its size as output.
+        """
+        items = iter(items)
+        while True:
+            start = timer()
+            try:
+                item = next(items)
+            except StopIteration:
+                self.stage(name)['seconds'] += timer() - start
+                break
+            self.record(name, start, data_out=item)
+            yield item
+        self.done(name)
+
+    def as_dict(self):
+        """Return the records of all stages and the match counts.
+        """
+        return OrderedDict([('stages', self.stages),
+            ('matches', self.matches)])
+
+    def write_json(self, fout):
+        """Write all records as JSON.
+        """
+        import json
+
+        json.dump(self.as_dict(), fout, indent=2)
+        fout.write('\n')
+
+    def write_table(self, fout):
+        """Write all records as a table.
+        """
+        fout.write("{:<18} {:>10} {:>8} {:>12} {:>12}\n".format(
+            'stage', 'seconds', 'calls', 'bytes in', 'bytes out'))
+        for name, record in self.stages.items():
+            fout.write("{:<18} {:>10.4f} {:>8} {:>12} {:>12}\n".format(name,
+                record['seconds'], record['calls'], record['bytes_in'],
+                record['bytes_out']))
+        fout.write("matches: {}\n".format(', '.join("{} {}".format(branch,
+            count) for branch, count in self.matches.items())))
+
+def options_key(options):
+    """Return a string identifying the options (begin, contain, noref,
+    html, normalize_urls, markdown) which change the output
+    of a conversion.
+    """
+    import json
+
+    return json.dumps([CACHE_VERSION, options.get('begin'),
+        bool(options.get('contain')), bool(options.get('noref')),
+        bool(options.get('html')), bool(options.get('normalize_urls')),
+        bool(options.get('markdown'))])
+
+class ResultCache(object):
+    """Store converted documents in a directory on disk, keyed by
+    a hash of the input and of the options which change the output.
+
+    Entries are written to a temporary file and renamed, so several
+    processes can share a cache. Every hit marks the entry as used by
+    updating its modification time; once the entries are larger than
+    max_size bytes, the least recently used ones are removed. Their
+    size is kept up to date in the file .size, so the directory is
+    only read when the cache gets too large.
+    """
+    def __init__(self, directory, max_size=CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                # created by another process in the meantime
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def key(self, data, options):
+        """Return the key of the document data (bytes, or a file
+        opened in binary mode) converted with the options (begin,
+        contain, noref, html, normalize_urls, markdown).
+        """
+        import hashlib
+
+        key = hashlib.sha256()
+        key.update(options_key(options).encode('utf-8'))
+        if isinstance(data, bytes):
+            key.update(data)
+        else:
+            for chunk in iter(lambda: data.read(CHUNK_SIZE), b''):
+                key.update(chunk)
+        return key.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.txt')
+
+    def get(self, key):
+        """Return the cached output for key as a file opened for
+        reading, or None if there is none.
+        """
+        path = self.path(key)
+        try:
+            f = open(path, 'r', encoding='utf-8', newline='')
+        except (IOError, OSError):
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            # removed by another process, but still open
+            pass
+        return f
+
+    def put(self, key, lines):
+        """Store the output lines for key.
+        """
+        import tempfile
+
+        fd, tmpname = tempfile.mkstemp(prefix='.', suffix='.tmp',
+            dir=self.directory)
+        try:
+            with io.open(fd, 'w', encoding='utf-8', newline='\n') as fout:
+                fout.writelines(lines)
+            size = os.path.getsize(tmpname)
+            os.replace(tmpname, self.path(key))
+        except BaseException:
+            os.remove(tmpname)
+            raise
+        self.evict(size)
+
+    def put_file(self, key, filename):
+        """Store the output file filename for key.
+        """
+        with open(filename, 'r', encoding='utf-8', newline='') as f:
+            self.put(key, f)
+
+    def evict(self, added=0):
+        """Add the size of an entry just stored (added bytes) to the
+        size of the cache and remove the least recently used entries
+        if it gets larger than max_size. The size kept in .size may be
+        too large (after entries were replaced or removed), but is
+        exact again once the entries have been read to remove some.
+        """
+        size_path = os.path.join(self.directory, '.size')
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(size_path, 'r') as f:
+                    size = int(f.read()) + added
+            except (IOError, OSError, ValueError):
+                # no size kept yet, or only partly written
+                size = None
+            if size is not None and size <= self.max_size:
+                with open(size_path, 'w') as f:
+                    f.write(str(size))
+                return
+            entries = []
+            size = 0
+            for name in os.listdir(self.directory):
+                if not name.endswith('.txt'):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((info.st_mtime, info.st_size, path))
+                size += info.st_size
+            entries.sort()
+            for mtime, entry_size, path in entries:
+                if size <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                size -= entry_size
+            with open(size_path, 'w') as f:
+                f.write(str(size))
+
+class ParagraphIndex(object):
+    """Sidecar file of incremental conversions (see --incremental):
+    the references found in every paragraph of the document converted
+    last, by hash of the paragraph, to reuse them for the paragraphs
+    which did not change since. Only the references and their offsets
+    in the lines are kept, not the text of the paragraphs.
+
+    The index is only used with the same options and the same old
+    appendix as the conversion that wrote it.
+    """
+    def __init__(self, path, options):
+        import json
+
+        self.path = path
+        self.options = options_key(options)
+        self.old_appendix = None
+        # hash of a paragraph -> matches and references found by
+        # find_paragraph_references
+        self.paragraphs = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        if not isinstance(index, dict) or index.get('options') != self.options:
+            return
+        self.old_appendix = index.get('old_appendix')
+        for key, (counts, found) in index.get('references', {}).items():
+            # references are stored as lists in JSON
+            self.paragraphs[key] = [counts, [[line, start, end, tuple(part)
+                if part.__class__ is list else part]
+                for line, start, end, part in found]]
+
+    def save(self):
+        """Write the index to its file.
+        """
+        import json
+
+        write_output(self.path, [json.dumps({'options': self.options,
+            'old_appendix': self.old_appendix,
+            'references': self.paragraphs})], atomic=True)
+
+def iter_paragraphs(lines):
+    """Yield lists of the lines of every paragraph (up to and including
+    the next empty line).
+    """
+    paragraph = []
+    for line in lines:
+        paragraph.append(line)
+        if line == '\n':
+            yield paragraph
+            paragraph = []
+    if len(paragraph) > 0:
+        yield paragraph
+
+class Converter(object):
+    """Convert the references of one document to numbered footnotes.
+
+    All reference state (references, old appendix, counters) lives on
+    the instance, so a new Converter is used for every document and
+    any number of documents can be converted in the same process.
+    """
+    def __init__(self, begin=None, contain=False, noref=False, html=False,
+            verbose=False, profile=None, normalize_urls=False, markdown=False,
+            html_backend='htmlparser', index_references=False):
+        self.begin = begin
+        self.contain = contain
+        self.noref = noref
+        self.html = html
+        # name of the class reading whole HTML documents (see
+        # HTML_BACKENDS); HTML read in chunks is always read by HTMLStream
+        self.html_backend = html_backend
+        self.markdown = markdown
+        self.verbose = verbose
+        # find different forms of the same URL (see normalize_url);
+        # the first form found is used in the appendix:
+        # normalized URL -> form used
+        self.normalize_urls = normalize_urls
+        self.url_forms = {}
+        # Profile recording the stages of the conversion, if any
+        self.profile = profile
+        # number of matches per branch of the reference pattern
+        # (see BRANCHES) if they are counted
+        self.matches = None if profile is None else profile.matches
+        # create a dictionary to store all references (in order of
+        # appearance, numbered 1, 2, ... so the counter is their number)
+        # create an array of flags to keep track of duplicate references,
+        # indexed by number (one byte per reference instead of a copy)
+        # add counter for references
+        # add counter for e-mail signature
+        # (plain dictionaries keep their order and take half the memory
+        # of an OrderedDict)
+        self.references = {}
+        self.oldreferences = {}
+        # index of the old appendix by number: number -> references
+        # position of old references in the old appendix (built when needed)
+        self.oldnumbers = {}
+        self.oldorder = None
+        self.appendix_find = 0
+        self.appendix_start = 0
+        self.appendix_lines = 0
+        self.duplicate_ref = bytearray(1)
+        self.counter = 0
+        self.signature = 0
+        # where references occur in the output if indexing them (see
+        # reference_index): [line, offset, count] of each reference by
+        # number (minus one), lines output so far and the offset of the
+        # reference being numbered in its line
+        self.occurrences = [] if index_references else None
+        self.output_lines = 0
+        self.output_offset = 0
+        self.line_shift = 0
+
+    def status(self, msg):
+        """Print a status message if running verbosely.
+        """
+        if self.verbose:
+            print(msg)
+
+    def html_to_text(self, html_string):
+        """Convert HTML to plaintext, beginning at the string
+        given as begin option if present.
+        """
+        if self.begin:
+            beginparse = self.begin
+            try:
+                html_split = html_string.split(beginparse, maxsplit=1)
+            except TypeError:
+                html_split = html_string.split(beginparse, 1)
+            if len(html_split) > 1:
+                if self.contain is True:
+                    parsestring = beginparse + html_split[1]
+                else:
+                    parsestring = html_split[1]
+                return self.parse_html(parsestring)
+            else:
+                self.status("::: Attn: the starting point \"" + beginparse
+                    + "\" for parsing was not found.") # status msg
+                return self.parse_html(html_split[0])
+        return self.parse_html(html_string)
+
+    def parse_html(self, html):
+        """Convert HTML to plaintext, recording both stages
+        if profiling.
+        """
+        from textref.htmltext import html_backend, html_to_text
+
+        if self.profile is None:
+            return html_to_text(html, self.html_backend)
+        start = timer()
+        content = html_backend(self.html_backend)()
+        content.feed(html)
+        self.profile.record('html.feed', start, html, content.result)
+        self.profile.done('html.feed')
+        start = timer()
+        text = content.concatenate()
+        self.profile.record('html.concatenate', start, content.result, text)
+        self.profile.done('html.concatenate')
+        return text
+
+    def iter_html_to_text(self, chunks):
+        """Convert HTML read in chunks to plaintext paragraph by
+        paragraph, beginning at the string given as begin option
+        if present.
+        """
+        from textref.htmltext import iter_html_to_text
+
+        if self.profile is None:
+            return iter_html_to_text(self.begin_chunks(chunks))
+        return self.profile.iterate('html.feed', iter_html_to_text(
+            self.profile_input(self.profile.stage('html.feed'),
+                self.begin_chunks(chunks))))
+
+    def markdown_to_text(self, lines):
+        """Convert the links in lines of Markdown and yield the
+        resulting lines paragraph by paragraph.
+        """
+        from textref.markdowntext import iter_markdown_to_text
+
+        if self.profile is None:
+            return iter_markdown_to_text(lines)
+        return self.profile.iterate('markdown', iter_markdown_to_text(
+            self.profile_input(self.profile.stage('markdown'), lines)))
+
+    def begin_chunks(self, chunks):
+        """Yield the chunks of HTML from the string given as
+        begin option onwards. Chunks are spooled to a temporary file
+        until the string is found, to convert the whole file if not.
+        """
+        if not self.begin:
+            for chunk in chunks:
+                yield chunk
+            return
+        import tempfile
+
+        beginparse = self.begin
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE,
+            mode='w+', encoding='utf-8', newline='')
+        window = u''
+        for chunk in chunks:
+            spool.write(chunk)
+            # keep enough of the last chunk to find the string across chunks
+            window = window + chunk
+            start = window.find(beginparse)
+            if start != -1:
+                spool.close()
+                if self.contain is True:
+                    yield window[start:]
+                else:
+                    yield window[start + len(beginparse):]
+                for chunk in chunks:
+                    yield chunk
+                return
+            window = window[max(0, len(window) - len(beginparse) + 1):]
+        self.status("::: Attn: the starting point \"" + beginparse
+            + "\" for parsing was not found.") # status msg
+        spool.seek(0)
+        for chunk in iter(lambda: spool.read(CHUNK_SIZE), ''):
+            yield chunk
+        spool.close()
+
+    def appendix(self):
+        """Yield the lines of an appendix (list of references/footnotes).
+        """
+        # separate footnotes with separator. use _ instead of dashes
+        # as -- is read as the beginning of a signature by e-mail clients
+        yield u'___\n'
+        # write appendix/bibliography
+        for ref, no in self.references.items():
+            if self.markdown:
+                # the output is passed through show_brackets
+                ref = escape_hidden(ref)
+            yield u"[{}] {}\n" .format(no, ref)
+
+    def profiled_appendix(self):
+        """Return the lines of the appendix, recording
+        them if profiling.
+        """
+        if self.profile is None:
+            return self.appendix()
+        return self.profile.iterate('appendix', self.appendix())
+
+    def write_appendix(self, fout):
+        """Write an appendix (list of references/footnotes).
+        """
+        for line in self.appendix():
+            fout.write(line)
+
+    def reference_index(self):
+        """Yield the references as lines of JSON (JSON Lines): number,
+        reference, whether it is a URL, line (counting from 1) and offset
+        of its first footnote marker in the output and number of
+        footnote markers. Needs index_references.
+        """
+        import json
+
+        for ref, no in self.references.items():
+            line, offset, count = self.occurrences[no - 1]
+            yield json.dumps(OrderedDict([('number', no), ('reference', ref),
+                ('url', is_url(ref)), ('line', line), ('offset', offset),
+                ('count', count)]), ensure_ascii=False) + '\n'
+
+    def write_reference_index(self, fout):
+        """Write the references as JSON Lines (see reference_index).
+        """
+        for line in self.reference_index():
+            fout.write(line)
+
+    def inspect_brackets(self, matchobj):
+        """Further break down any regex matches for brackets.
+        """
+        found = self.find_reference(matchobj)
+        if found.__class__ is tuple:
+            return self.number_reference(*found)
+        return found
+
+    def index_brackets(self, matchobj):
+        """Like inspect_brackets, but keep track of the offset
+        of the references in the output line.
+        """
+        self.output_offset = matchobj.start() + self.line_shift
+        found = self.inspect_brackets(matchobj)
+        self.line_shift += len(found) - (matchobj.end() - matchobj.start())
+        return found
+
+    def find_reference(self, matchobj):
+        """Find the reference in a regex match for brackets. Return
+        the text to replace the match with if it is no (new) reference,
+        otherwise the reference as (kind, content, old number, text
+        following the brackets) to be numbered by number_reference.
+        Only depends on the old appendix, not on other references.
+        """
+        (fullref, brkts_rd_content, brkts_sq_content, brkts_sq_digit,
+            brkts_rd_spacemissing, brkts_sq_spacemissing,
+            brkts_sq_d_spacemissing, brkts_sq_quote, brkts_sq_quopen,
+            brkts_sq_quclose) = matchobj.group(0, 'rd', 'sq', 'sq_d',
+                'rd_word', 'sq_word', 'sq_d_word', 'sq_qu_quotes',
+                'sq_qu_open', 'sq_qu_close')
+
+        if self.matches is not None:
+            if brkts_rd_content is not None:
+                self.matches['rd'] += 1
+            elif brkts_sq_quote is not None:
+                self.matches['sq_qu'] += 1
+            elif brkts_sq_digit is not None:
+                self.matches['sq_d'] += 1
+            else:
+                self.matches['sq'] += 1
+
+        if brkts_sq_quopen is not None:
+            brkts_sq_quopen = "\""
+        if brkts_sq_quclose is not None:
+            brkts_sq_quclose = "\""
+        # append space if word follows immediately after brackets
+        if brkts_rd_spacemissing is not None and brkts_rd_spacemissing != '':
+            brkts_append = ' ' + brkts_rd_spacemissing
+        elif brkts_sq_spacemissing is not None and brkts_sq_spacemissing != '':
+            brkts_append = ' ' + brkts_sq_spacemissing
+        elif brkts_sq_d_spacemissing is not None and brkts_sq_d_spacemissing != '':
+            brkts_append = ' ' + brkts_sq_d_spacemissing
+        else:
+            brkts_append = ''
+
+        # use existing references if they were indeed part of old appendix
+        if brkts_sq_digit is not None:
+            oldref = self.old_reference(brkts_sq_digit)
+            if oldref is not None:
+                brkts_sq_content = oldref
+
+        # regex search found round brackets
+        if brkts_rd_content is not None:
+            # verify brackets start with URL;
+            # check for attributes: scheme (URL scheme specifier) and
+            # netlocat (Network location part)
+            if is_url(brkts_rd_content):
+                return ('rd', brkts_rd_content, None, brkts_append)
+            # return original bracket content if it's not a URL
+            else:
+                return fullref
+        # regex search found square brackets in quotations marks
+        elif brkts_sq_quote is not None:
+            ref = brkts_sq_quopen + brkts_sq_quote + brkts_sq_quclose
+            return ref
+        # regex search found square brackets
+        elif brkts_sq_content is not None:
+            if brkts_sq_content == 'sic' and brkts_sq_content == 'sic!':
+                # return original bracket content if not a match
+                return fullref
+            else:
+                # if brkts_sq_content == '1':
+                #     print("warning, there already is a [1]")
+                return ('sq', brkts_sq_content, brkts_sq_digit, brkts_append)
+        # regex search did not find any brackets
+        else:
+            # delete in-text ref that do not belong to footnotes in old appendix
+            if brkts_sq_digit is not None and brkts_sq_content is None:
+                return ''
+            return fullref
+
+    def profile_input(self, record, source):
+        """Yield the lines (or chunks) of the source, recording
+        their size as input of a stage.
+        """
+        for line in source:
+            record['bytes_in'] += text_size(line)
+            yield line
+
+    def number_reference(self, kind, content, digit, append):
+        """Number a reference found by find_reference, in order of
+        appearance, and return the footnote marker replacing it.
+        """
+        if self.markdown:
+            # references may contain Markdown code
+            content = show_brackets(content)
+        if kind == 'rd':
+            if self.normalize_urls:
+                content = self.url_forms.setdefault(normalize_url(content),
+                    content)
+            refno = self.references.get(content)
+            if refno is not None:
+                self.status("Note: multiple occurrence of reference {}"
+                        .format(content)) # status msg
+            else:
+                self.counter += 1
+                refno = self.counter
+                self.references[content] = refno
+                self.duplicate_ref.append(0)
+        else:
+            refno = self.references.get(content)
+            if refno is not None:
+                if digit is None and not self.duplicate_ref[refno]:
+                    self.duplicate_ref[refno] = 1
+                    self.status("Note: multiple occurrence of reference "
+                        "\"{}\"".format(content)) # status msg
+            else:
+                self.counter += 1
+                refno = self.counter
+                self.references[content] = refno
+                self.duplicate_ref.append(0)
+        if self.occurrences is not None:
+            self.count_occurrence(refno)
+        return "[" + str(refno) + "]" + append
+
+    def count_occurrence(self, refno):
+        """Record an occurrence of the reference numbered refno
+        at the current line and offset of the output.
+        """
+        if refno > len(self.occurrences):
+            self.occurrences.append([self.output_lines + 1,
+                self.output_offset, 1])
+        else:
+            self.occurrences[refno - 1][2] += 1
+
+    def parse_oldrefs(self, matchobj):
+        """Parse existing references.
+        """
+        fullref = matchobj.group(0)
+        no = matchobj.group(1)
+        ref = matchobj.group(2)
+
+        if ref is not None and ref != '':
+            if self.oldreferences.get(ref) != no:
+                self.oldnumbers.setdefault(no, []).append(ref)
+            # new references change the order of the old appendix
+            if ref not in self.oldreferences:
+                self.oldorder = None
+            self.oldreferences[ref] = no
+            return ''
+
+    def old_reference(self, no):
+        """Find the first reference in the old appendix
+        that is numbered no.
+        """
+        refs = self.oldnumbers.get(no)
+        if refs is None:
+            return None
+        # references listed again under another number since
+        found = [ref for ref in refs if self.oldreferences[ref] == no]
+        if len(found) <= 1:
+            return found[0] if found else None
+        # several references with the same number: the first one listed
+        if self.oldorder is None:
+            self.oldorder = dict((ref, index)
+                for index, ref in enumerate(self.oldreferences))
+        return min(found, key=self.oldorder.get)
+
+    def old_refs(self, sourcefile):
+        """Incorporate existing references into a new appendix.
+        """
+        if self.profile is not None:
+            start = timer()
+            record = self.profile.stage('old_refs')
+            sourcefile = self.profile_input(record, sourcefile)
+        linecount = 0
+        # look for an existing appendix in the source file
+        for line in sourcefile:
+            linecount += 1
+            self.old_refs_line(line, linecount)
+        if self.profile is not None:
+            self.profile.record('old_refs', start)
+            self.profile.done('old_refs')
+
+        # NOTE: looking for old appendix is now default
+        # if appendix_find == 0:
+            # print("::: Attn: old appendix not found!") # status msg
+
+    def old_refs_line(self, line, linecount):
+        """Incorporate existing references in line number linecount
+        of the source (counting from 1) into a new appendix.
+        """
+        # appendix found
+        if line == '___\n':
+            self.appendix_find = 1
+            self.appendix_start = linecount
+            self.appendix_lines += 1
+            self.status("Old appendix found.") # status msg
+        # count all valid references
+        if self.appendix_find == 1:
+            the_refs = re.sub('\\[(\\d+)\\] *(.+)\n*', self.parse_oldrefs, line)
+            if the_refs == '':
+                self.appendix_lines += 1
+
+    def convert_line(self, line):
+        """Substitute references in a single line and yield the output,
+        including the new appendix if the line marks an e-mail signature.
+        """
+        # if the current line does not mark an e-mail signature
+        if line != '--\n':
+            # write back all lines, changed or unchanged;
+            # all brackets searched for include '(' or '['
+            if self.profile is not None:
+                start = timer()
+            if '(' in line or '[' in line:
+                if self.occurrences is None:
+                    line_out = REFERENCES.sub(self.inspect_brackets, line)
+                else:
+                    self.line_shift = 0
+                    line_out = REFERENCES.sub(self.index_brackets, line)
+            else:
+                line_out = line
+            if self.profile is not None:
+                self.profile.record('substitution', start, line, line_out)
+            self.output_lines += 1
+            yield line_out
+        # include appendix before e-mail signature
+        # if the current line marks such a signature (--)
+        else:
+            self.signature = 1
+            if len(self.references) > 0:
+                for appendix_line in self.profiled_appendix():
+                    self.output_lines += 1
+                    yield appendix_line
+                self.status("Appendix created.") # status msg
+            else:
+                self.status("No references found.") # status msg
+            self.output_lines += 2
+            yield u'\n' + line
+
+    def finish(self):
+        """Yield the new appendix at the end of the document
+        if no signature was found.
+        """
+        # include appendix at end if no signature was found
+        if self.signature == 0 and len(self.references) > 0:
+            yield u'\n\n'
+            for appendix_line in self.profiled_appendix():
+                yield appendix_line
+            self.status("Appendix created.") # status msg
+        if len(self.references) <= 0:
+            self.status("No references found.") # status msg
+        if self.profile is not None:
+            self.profile.done('substitution')
+
+    def convert_lines(self, source):
+        """Substitute references in all lines of the source and yield
+        the resulting lines, including the new appendix.
+        Call old_refs on the same source first to re-index
+        an existing appendix.
+        """
+        for line_out in self.substitute_lines(source):
+            yield line_out
+        for line_out in self.finish():
+            yield line_out
+
+    def substitute_lines(self, source):
+        """Substitute references in all lines of the source except for
+        the old appendix and yield the resulting lines.
+        """
+        for line in self.document_lines(source):
+            for line_out in self.convert_line(line):
+                yield line_out
+
+    def document_lines(self, source, countlines=0):
+        """Yield the lines of the source except for the old appendix,
+        countlines being the number of lines before the source.
+        """
+        # iterate over all lines
+        for line in source:
+            countlines += 1
+            # skip lines that are part of old appendix
+            if (line != '--\n' and self.appendix_find > 0
+                    and countlines >= self.appendix_start
+                    and countlines <= (self.appendix_start + self.appendix_lines)):
+                continue
+            yield line
+
+    def convert_mapped(self, data):
+        """Convert a text document given as bytes encoded as UTF-8
+        (like a memory-mapped file) without any '\\r'. Read the old
+        appendix and return an iterator over the output as pieces
+        of bytes.
+
+        Only lines which contain brackets or mark a signature or the
+        old appendix are decoded and converted; all other lines are
+        checked to be valid UTF-8 and passed on as they are.
+        """
+        view = memoryview(data)
+        end = len(data)
+        # look for an existing appendix from the first '___' line on
+        appendix = find_line(data, b'___\n', 0, end)
+        if appendix == -1:
+            skip_start = skip_end = end
+        else:
+            self.old_refs(line.decode('utf-8')
+                for line in mapped_lines(data, appendix, end))
+            # lines of the old appendix skipped like substitute_lines does
+            skip_start = skip_lines(data, appendix, end,
+                self.appendix_start - 1)
+            skip_end = skip_lines(data, skip_start, end,
+                self.appendix_lines + 1)
+        return self.mapped_pieces(data, view, skip_start, skip_end)
+
+    def mapped_pieces(self, data, view, skip_start, skip_end):
+        """Yield the output of convert_mapped, skipping the lines
+        of the old appendix from skip_start to skip_end.
+        """
+        end = len(data)
+        for piece in self.convert_span(data, view, 0, skip_start):
+            yield piece
+        for line in mapped_lines(data, skip_start, skip_end):
+            if line == b'--\n':
+                for line_out in self.convert_line('--\n'):
+                    yield line_out.encode('utf-8')
+        for piece in self.convert_span(data, view, skip_end, end):
+            yield piece
+        for line_out in self.finish():
+            yield line_out.encode('utf-8')
+
+    def convert_span(self, data, view, pos, end):
+        """Convert the lines of data from pos to end (both beginnings
+        of lines) and yield the output as pieces of bytes.
+        """
+        # next positions of lines which need to be converted
+        # (end: no more such lines)
+        next_round = next_square = next_signature = -1
+        while pos < end:
+            if next_round < pos:
+                next_round = data.find(b'(', pos, end)
+                if next_round == -1:
+                    next_round = end
+            if next_square < pos:
+                next_square = data.find(b'[', pos, end)
+                if next_square == -1:
+                    next_square = end
+            if next_signature < pos:
+                next_signature = find_line(data, b'--\n', pos, end)
+                if next_signature == -1:
+                    next_signature = end
+            candidate = min(next_round, next_square, next_signature)
+            if candidate == end:
+                if self.occurrences is not None:
+                    self.output_lines += count_lines(data, pos, end)
+                check_utf8(view[pos:end])
+                yield view[pos:end]
+                return
+            line_start = data.rfind(b'\n', pos, candidate)
+            line_start = pos if line_start == -1 else line_start + 1
+            line_end = data.find(b'\n', candidate, end)
+            line_end = end if line_end == -1 else line_end + 1
+            # lines without brackets are copied as they are
+            if line_start > pos:
+                if self.occurrences is not None:
+                    self.output_lines += count_lines(data, pos,
+                        line_start)
+                check_utf8(view[pos:line_start])
+                yield view[pos:line_start]
+            line = bytes(view[line_start:line_end]).decode('utf-8')
+            for line_out in self.convert_line(line):
+                yield line_out.encode('utf-8')
+            pos = line_end
+
+    def convert_lines_parallel(self, source, pool, chunk_lines=CHUNK_LINES):
+        """Like convert_lines, but find references in chunks of
+        chunk_lines lines on the process pool. The references found
+        are then numbered in order of appearance, giving the same output.
+        Call old_refs on the same source first.
+        """
+        lines = list(self.document_lines(source))
+        chunks = [lines[start:start + chunk_lines]
+            for start in range(0, len(lines), chunk_lines)]
+        del lines
+        profile = self.profile
+        if profile is not None:
+            start = timer()
+        chunk_results = pool.map(find_references, chunks,
+            [(self.oldreferences, self.oldnumbers)] * len(chunks),
+            [profile is not None] * len(chunks))
+        for chunk, (lines_found, matches) in zip(chunks, chunk_results):
+            if profile is None:
+                for line_out in self.number_lines(lines_found):
+                    yield line_out
+                continue
+            # record the time spent waiting for the chunk and numbering it
+            for branch, count in matches.items():
+                profile.matches[branch] += count
+            lines_out = self.number_profiled(chunk, lines_found, start)
+            for line_out in lines_out:
+                yield line_out
+            start = timer()
+        for line_out in self.finish():
+            yield line_out
+
+    def convert_lines_incremental(self, source, index):
+        """Like convert_lines, but only search the paragraphs which
+        changed since the conversion that wrote the ParagraphIndex index
+        for references, then number all references in order of
+        appearance, giving the same output. The index is updated with
+        the paragraphs of the source. Call old_refs on the same
+        source first.
+        """
+        import hashlib
+        import json
+
+        old_appendix = hashlib.sha1(json.dumps([list(self.oldreferences.items()),
+            sorted(self.oldnumbers.items())]).encode('utf-8')).hexdigest()
+        if index.old_appendix != old_appendix:
+            index.paragraphs = {}
+        known = index.paragraphs
+        paragraphs = {}
+        profile = self.profile
+        for paragraph in iter_paragraphs(self.document_lines(source)):
+            if profile is not None:
+                start = timer()
+            key = hashlib.sha1(''.join(paragraph).encode('utf-8')).hexdigest()
+            found = paragraphs.get(key)
+            if found is None:
+                found = known.get(key)
+            if found is None:
+                found = self.find_paragraph_references(paragraph)
+            paragraphs[key] = found
+            counts, references = found
+            lines_found = self.paragraph_lines(paragraph, references)
+            if profile is None:
+                for line_out in self.number_lines(lines_found):
+                    yield line_out
+                continue
+            # paragraphs found in the index count their matches as well
+            for branch, count in zip(BRANCHES, counts):
+                profile.matches[branch] += count
+            lines_out = self.number_profiled(paragraph, lines_found, start)
+            for line_out in lines_out:
+                yield line_out
+        index.old_appendix = old_appendix
+        index.paragraphs = paragraphs
+        for line_out in self.finish():
+            yield line_out
+
+    def number_lines(self, lines_found):
+        """Number the references in lines found by find_line_references
+        and yield the resulting lines.
+        """
+        for found in lines_found:
+            # e-mail signature
+            if found is None:
+                for line_out in self.convert_line('--\n'):
+                    yield line_out
+            elif found.__class__ is list:
+                if self.occurrences is None:
+                    line_out = ''.join([part if part.__class__ is not tuple
+                        else self.number_reference(*part) for part in found])
+                else:
+                    line_out = self.index_parts(found)
+                self.output_lines += 1
+                yield line_out
+            else:
+                self.output_lines += 1
+                yield found
+
+    def number_profiled(self, lines, lines_found, start):
+        """Like number_lines, given the source lines the references
+        were found in, but return a list of the resulting lines and
+        record them as a call of the substitution stage which started
+        at start (see timer).
+        """
+        lines_out = []
+        lines_in = []
+        lines_substituted = []
+        for line, found in zip(lines, lines_found):
+            for line_out in self.number_lines([found]):
+                lines_out.append(line_out)
+                # the appendix is recorded as a stage of its own
+                if found is not None:
+                    lines_in.append(line)
+                    lines_substituted.append(line_out)
+        self.profile.record('substitution', start, lines_in,
+            lines_substituted)
+        return lines_out
+
+    def index_parts(self, parts):
+        """Number the references in a line found by find_line_references
+        like number_lines, keeping track of their offset in the output
+        line, and return the resulting line.
+        """
+        line_out = []
+        self.output_offset = 0
+        for part in parts:
+            if part.__class__ is tuple:
+                part = self.number_reference(*part)
+            line_out.append(part)
+            self.output_offset += len(part)
+        return ''.join(line_out)
+
+    def find_line_references(self, line):
+        """Find the references in a single line. Return None if the line
+        marks an e-mail signature, the line as it is if it contains no
+        new references, otherwise a list of the text in between and the
+        references as found by find_reference.
+        """
+        if line == '--\n':
+            return None
+        if '(' not in line and '[' not in line:
+            return line
+        parts = []
+        text = []
+        end = 0
+        for matchobj in REFERENCES.finditer(line):
+            text.append(line[end:matchobj.start()])
+            found = self.find_reference(matchobj)
+            if found.__class__ is tuple:
+                parts.append(''.join(text))
+                parts.append(found)
+                text = []
+            else:
+                text.append(found)
+            end = matchobj.end()
+        text.append(line[end:])
+        if len(parts) == 0:
+            return ''.join(text)
+        parts.append(''.join(text))
+        return parts
+
+    def find_paragraph_references(self, paragraph):
+        """Find the references in the lines of a paragraph. Return
+        the number of matches per branch of the reference pattern (in
+        the order of BRANCHES) and a list of [line, start, end, found]
+        for every match which is replaced: the number of the line in
+        the paragraph, the offsets of the match in the line and the
+        replacement as returned by find_reference.
+        """
+        matches = self.matches
+        self.matches = OrderedDict((branch, 0) for branch in BRANCHES)
+        found = []
+        for number, line in enumerate(paragraph):
+            if line == '--\n' or ('(' not in line and '[' not in line):
+                continue
+            for matchobj in REFERENCES.finditer(line):
+                part = self.find_reference(matchobj)
+                if part != matchobj.group(0):
+                    found.append([number, matchobj.start(), matchobj.end(),
+                        part])
+        counts = list(self.matches.values())
+        self.matches = matches
+        return [counts, found]
+
+    def paragraph_lines(self, paragraph, found):
+        """Yield the lines of a paragraph as find_line_references
+        does, given the references found in it by
+        find_paragraph_references.
+        """
+        found = iter(found)
+        following = next(found, None)
+        for number, line in enumerate(paragraph):
+            if line == '--\n':
+                yield None
+                continue
+            if following is None or following[0] != number:
+                yield line
+                continue
+            parts = []
+            text = []
+            end = 0
+            while following is not None and following[0] == number:
+                text.append(line[end:following[1]])
+                part = following[3]
+                if part.__class__ is tuple:
+                    parts.append(''.join(text))
+                    parts.append(part)
+                    text = []
+                else:
+                    text.append(part)
+                end = following[2]
+                following = next(found, None)
+            text.append(line[end:])
+            if len(parts) == 0:
+                yield ''.join(text)
+            else:
+                parts.append(''.join(text))
+                yield parts
+
+    def stream(self, source):
+        """Substitute references in a single pass over the source
+        and yield the resulting lines as they are converted.
+
+        Lines are converted as soon as they are read. Only once an
+        existing reference like [1] or an old appendix ('___') is found,
+        lines are held back (spooled to a temporary file once they get
+        large) until the end of the source, so the references can be
+        renumbered and the old appendix left out like by old_refs.
+        """
+        pending = None
+        pending_start = 0
+        linecount = 0
+        for line in source:
+            linecount += 1
+            self.old_refs_line(line, linecount)
+            if (pending is None and (self.appendix_find == 1
+                    or OLD_REFERENCE.search(line) is not None)):
+                import tempfile
+
+                pending = tempfile.SpooledTemporaryFile(
+                    max_size=SPOOL_SIZE, mode='w+', encoding='utf-8',
+                    newline='\n')
+                pending_start = linecount - 1
+            if pending is not None:
+                pending.write(line)
+                continue
+            for line_out in self.convert_line(line):
+                yield line_out
+        if pending is not None:
+            for line_out in self._flush(pending, pending_start):
+                yield line_out
+        for line_out in self.finish():
+            yield line_out
+
+    def _flush(self, pending, countlines):
+        """Convert and yield lines held back by stream, countlines
+        being the number of lines before them.
+        """
+        pending.seek(0)
+        for line in self.document_lines(pending, countlines):
+            for line_out in self.convert_line(line):
+                yield line_out
+        pending.close()
+
+    def convert(self, text):
+        """Convert a complete document and return the output text.
+        """
+        if self.profile is not None:
+            start = timer()
+        output = self._convert(text)
+        if self.profile is not None:
+            self.profile.record('total', start, text, output)
+            self.profile.done('total')
+        return output
+
+    def _convert(self, text):
+        if self.html:
+            # read linebreaks like files read as text
+            text = self.html_to_text(text.replace('\r\n', '\n')
+                .replace('\r', '\n'))
+            # don't create any footnotes if noref is set
+            # (only converts html to plaintext)
+            if self.noref:
+                return text
+            # create list of lines
+            source = text.splitlines(True)
+        elif self.markdown:
+            source = list(self.markdown_to_text(io.StringIO(text,
+                newline=None)))
+            if self.noref:
+                return show_brackets(u''.join(source))
+            self.old_refs(source)
+            return show_brackets(u''.join(self.convert_lines(source)))
+        else:
+            source = list(io.StringIO(text, newline=None))
+        self.old_refs(source)
+        return u''.join(self.convert_lines(source))
+
+def find_line(data, line, start, end):
+    """Return the position of the first line of data (bytes) equal to
+    line (including its linebreak) between start (the beginning of a
+    line) and end, or -1 if there is none.
+    """
+    pos = data.find(line, start, end)
+    while pos > start and data[pos - 1:pos] != b'\n':
+        pos = data.find(line, pos + 1, end)
+    return pos
+
+def mapped_lines(data, start, end):
+    """Yield the lines of data (bytes, or a memory-mapped file) from
+    start (the beginning of a line) to end one at a time, as bytes.
+    """
+    while start < end:
+        line_end = data.find(b'\n', start, end)
+        line_end = end if line_end == -1 else line_end + 1
+        yield data[start:line_end]
+        start = line_end
+
+def skip_lines(data, start, end, count):
+    """Return the position count lines after start (the beginning
+    of a line) in data, or end if there are fewer lines.
+    """
+    for _ in range(count):
+        if start >= end:
+            break
+        start = data.find(b'\n', start, end)
+        start = end if start == -1 else start + 1
+    return start
+
+def check_utf8(data):
+    """Raise UnicodeDecodeError if data (bytes, or a memoryview of
+    whole lines) is not valid UTF-8, like reading it as text would.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for start in range(0, len(data), CHUNK_SIZE):
+        decoder.decode(data[start:start + CHUNK_SIZE])
+    decoder.decode(b'', True)
+
+def count_lines(data, start, end):
+    """Return the number of linebreaks in data (bytes, or a memory-mapped
+    file) between start and end.
+    """
+    return data[start:end].count(b'\n')
+
+def map_text_file(f):
+    """Memory-map the text file f (opened for reading) to convert it
+    with Converter.convert_mapped. Return None if it cannot be
+    converted byte by byte: if it is empty, contains '\\r' (which
+    would be read as a linebreak) or linebreaks would be written
+    differently.
+    """
+    if os.linesep != '\n' or os.fstat(f.fileno()).st_size == 0:
+        return None
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if data.find(b'\r') != -1:
+        data.close()
+        return None
+    return data
+
+def find_references(lines, old_appendix, count_matches=False):
+    """Find the references in lines of a document in a worker process,
+    given the old appendix (references and numbers) read by old_refs.
+    Return the lines found by find_line_references and the number of
+    matches per branch of the reference pattern if count_matches is
+    set (otherwise None).
+    """
+    converter = Converter()
+    converter.oldreferences, converter.oldnumbers = old_appendix
+    if count_matches:
+        converter.matches = OrderedDict((branch, 0) for branch in BRANCHES)
+    lines_found = [converter.find_line_references(line) for line in lines]
+    return lines_found, converter.matches
+
+def convert_text(text, options=None):
+    """Convert the references in text to numbered footnotes.
+
+    options is a dictionary of Converter keyword arguments
+    (begin, contain, noref, html, normalize_urls, markdown, html_backend,
+    profile).
+    Returns the converted text and the reference table (a dictionary
+    of reference -> number, in order of appearance).
+    """
+    converter = Converter(**(options or {}))
+    output = converter.convert(text)
+    return output, converter.references
+
+def iter_lines(pieces):
+    """Yield the lines of text given in pieces of any size.
+    """
+    rest = u''
+    for piece in pieces:
+        lines = (rest + piece).splitlines(True)
+        # the last line may continue in the next piece
+        rest = lines.pop(-1) if len(lines) > 0 else u''
+        for line in lines:
+            yield line
+    if rest != '':
+        yield rest
+
+# brackets in Markdown code and square brackets in the text of links
+# are hidden from the reference pattern as noncharacters until the
+# references have been substituted
+HIDDEN_BRACKETS = OrderedDict([('(', '\ufdd0'), (')', '\ufdd1'),
+    ('[', '\ufdd2'), (']', '\ufdd3')])
+# noncharacters already in Markdown are escaped as HIDDEN_ESCAPE
+# followed by the noncharacter five code points further on
+# (see escape_hidden), so they are not taken for hidden brackets
+HIDDEN_ESCAPE = '\ufdd4'
+HIDDEN = re.compile('[\ufdd0-\ufdd4]')
+ESCAPED_HIDDEN = re.compile('\ufdd4([\ufdd5-\ufdd9])')
+
+def escape_hidden(text):
+    """Return text with the noncharacters used by hide_brackets
+    escaped, to be restored by show_brackets.
+    """
+    if text.isascii() or HIDDEN.search(text) is None:
+        return text
+    return HIDDEN.sub(lambda m: HIDDEN_ESCAPE + chr(ord(m.group(0)) + 5),
+        text)
+
+def hide_brackets(text, brackets='()[]'):
+    """Return text with the brackets given replaced by noncharacters,
+    so they are not searched for references.
+    """
+    for bracket in brackets:
+        text = text.replace(bracket, HIDDEN_BRACKETS[bracket])
+    return text
+
+def show_brackets(text):
+    """Return text with the brackets hidden by hide_brackets
+    and the noncharacters escaped by escape_hidden restored.
+    """
+    # most lines are ASCII only, which is known without reading them
+    if text.isascii():
+        return text
+    for bracket, hidden in HIDDEN_BRACKETS.items():
+        text = text.replace(hidden, bracket)
+    if HIDDEN_ESCAPE in text:
+        text = ESCAPED_HIDDEN.sub(lambda m: chr(ord(m.group(1)) - 5), text)
+    return text
+
+def write_output(filename_out, lines, atomic=False, binary=False):
+    """Write the converted lines to filename_out in one buffered pass.
+    If atomic is set, write to a temporary file in the same directory
+    and rename it to filename_out once all lines are written.
+    If binary is set, lines are pieces of bytes encoded as UTF-8.
+    """
+    if binary:
+        mode, encoding = 'wb', None
+    else:
+        mode, encoding = 'w', 'utf-8'
+    if not atomic:
+        with open(filename_out, mode, encoding=encoding,
+                buffering=CHUNK_SIZE) as fout:
+            fout.writelines(lines)
+        return
+    import tempfile
+
+    directory, name = os.path.split(filename_out)
+    fd, tmpname = tempfile.mkstemp(prefix='.' + name + '.', suffix='.tmp',
+        dir=directory or '.')
+    try:
+        with io.open(fd, mode, encoding=encoding,
+                buffering=CHUNK_SIZE) as fout:
+            fout.writelines(lines)
+        # mkstemp creates files readable by the owner only
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmpname, 0o666 & ~umask)
+        os.replace(tmpname, filename_out)
+    except BaseException:
+        os.remove(tmpname)
+        raise
+
@@ -0,0 +1,601 @@
+# -*- coding: utf-8 -*-
+
+'''
+Change HTML to plaintext, keeping the URLs of hyperlinks in round
+brackets after their text to be converted to footnotes.
+
+Imported on first use by a Converter reading HTML, so html.parser and
+the patterns below are only loaded and compiled when HTML is converted.
+'''
+
+# Python2
+from __future__ import unicode_literals
+import re
+import sys
+import functools
+
+try:
+    # Python3
+    from html.parser import HTMLParser
+except ImportError:
+    # Python2
+    from HTMLParser import HTMLParser
+try:
+    # Python3
+    import html.entities
+except ImportError:
+    # Python2
+    import htmlentitydefs
+
+from textref.core import is_url
+
+class HTMLClean(HTMLParser):
+    """Class to clean HTML tags
+    and entities, including script tags.
+    """
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.result = []
+        # open <a> tags: (index of their URL in result, URL)
+        self.anchors = []
+        # index in result at the open <script> or <style> tag
+        self.cdata_start = None
+
+    def handle_starttag(self, tag, attrs):
+        """Look for hyperlinks and filter out their href attribute.
+        """
+        if tag == "br":
+            self.result.append('\n')
+        if tag == "script" or tag == "style":
+            self.cdata_start = len(self.result)
+        if tag == "a":
+            anchor = (len(self.result), None)
+            for attr in attrs:
+                if attr[0] == 'href':
+                    the_url = attr[1].strip()
+                    # all URLs get saved
+                    anchor = (len(self.result), the_url)
+                    self.result.append(the_url)
+            self.anchors.append(anchor)
+
+    def handle_data(self, data):
+        """Add content enclosed within various HTML tags.
+        """
+        self.result.append(data)
+
+    def handle_entityref(self, name):
+        """Convert HTML entities to their Unicode representations.
+        """
+        try:
+            html_entities = html.entities.name2codepoint[name]
+            self.result.append(chr(html_entities))
+        # Python2
+        except:
+            html_entities = htmlentitydefs.name2codepoint[name]
+            self.result.append(unichr(html_entities))
+
+    def handle_endtag(self, tag):
+        """Look for hyperlinks whose <a></a> tags include a description,
+        then switch URL and description (as saved in the results list).
+        Remove hyperlinks whose <a></a> tags surround other content.
+        """
+        count_data = len(self.result)
+        # linebreaks, paragraphs
+        if tag == "div":
+            self.result.append('\n\n')
+        if tag == "p":
+            self.result.append('\n\n')
+        # URL handling
+        if tag == "a" and len(self.anchors) >= 1:
+            start, last_url = self.anchors.pop(-1)
+            # remove hyperlink descriptions before closing </a> tags
+            # if they do not belong to proper hyperlinks
+            # + join hyperlink descriptions that belong together
+            if last_url is not None and count_data >= 2:
+                # the description follows the last piece equal to the URL,
+                # at the latest the URL saved at the opening <a> tag;
+                # the very first piece is never taken into account
+                index = count_data - 1
+                while index > max(start, 1) and self.result[index] != last_url:
+                    index -= 1
+                if self.result[index] == last_url:
+                    descriptions = self.result[index + 1:]
+                else:
+                    descriptions = self.result[index:]
+                del self.result[index:]
+                if len(descriptions) == 0:
+                    pass
+                else:
+                    descriptions_collected = ''.join(descriptions)
+                    if is_url(last_url):
+                        self.result.append(descriptions_collected)
+                        self.result.append(" (" + last_url + ")")
+                    else:
+                        self.result.append(descriptions_collected)
+
+        # remove any data that was inside <script> or <style> tags
+        if (tag == "script" or tag == "style") and self.cdata_start is not None:
+            del self.result[self.cdata_start:]
+            self.cdata_start = None
+
+    def concatenate(self):
+        """Concatenate all individual pieces of data,
+        trim whitespace at beginning and end of file and
+        remove various whitespace combinations found in HTML.
+        """
+        fulltext = u''.join(self.result)
+        fulltext = fulltext.lstrip()
+        fulltext = fulltext.rstrip()
+        return normalize_whitespace(fulltext)
+
+class HTMLStream(HTMLClean):
+    """Class to clean HTML fed in chunks, making the plaintext
+    of each paragraph available once its p or div tag has closed.
+    """
+    def __init__(self):
+        HTMLClean.__init__(self)
+        self.text = []
+        self.started = False
+        # data at the end of a chunk may continue in the next one
+        self.data_open = False
+        self.chunk_end = False
+
+    def feed(self, data):
+        """Feed a chunk of HTML to the parser.
+        """
+        rawdata = self.rawdata + data
+        # data always ends before a '<'
+        if rawdata.startswith('<'):
+            self.chunk_end = False
+        HTMLClean.feed(self, data)
+        # the parser keeps what it cannot read yet; data read up to
+        # there continues in the next chunk unless it is a '<' which
+        # does not start a tag (always passed on by itself), it is
+        # followed by '</>' (skipped without calling any handler)
+        # or the rest starts with '<'
+        rest = self.rawdata
+        read = len(rawdata) - len(rest)
+        if read > 0:
+            self.chunk_end = (self.data_open and rawdata[read - 1] != '<'
+                and not rawdata.endswith('</>', 0, read)
+                and not rest.startswith('<'))
+
+    def finish(self):
+        """Make the rest of the plaintext available
+        once all HTML has been fed.
+        """
+        # the parser keeps data running up to the end unread if it
+        # ends like a character reference, including the data of
+        # earlier chunks which would have been kept with it
+        rest = self.rawdata
+        if (self.chunk_end and rest != '' and not rest.startswith('<')
+                and len(self.result) > 0):
+            self.result.pop(-1)
+        fulltext = u''.join(self.result).rstrip()
+        if not self.started:
+            fulltext = fulltext.lstrip()
+        self.result = []
+        if fulltext != '':
+            self.text.append(normalize_whitespace(fulltext))
+
+    def pop_text(self):
+        """Return all plaintext finished so far.
+        """
+        text = self.text
+        self.text = []
+        return text
+
+    def handle_starttag(self, tag, attrs):
+        self.data_open = self.chunk_end = False
+        HTMLClean.handle_starttag(self, tag, attrs)
+
+    def handle_data(self, data):
+        # join data split up between two chunks like in a single feed
+        if self.chunk_end and len(self.result) >= 1:
+            self.result[-1] += data
+        else:
+            HTMLClean.handle_data(self, data)
+        self.data_open = True
+        self.chunk_end = False
+
+    def handle_entityref(self, name):
+        self.data_open = self.chunk_end = False
+        HTMLClean.handle_entityref(self, name)
+
+    def handle_comment(self, data):
+        self.data_open = self.chunk_end = False
+
+    def handle_decl(self, decl):
+        self.data_open = self.chunk_end = False
+
+    def handle_pi(self, data):
+        self.data_open = self.chunk_end = False
+
+    def unknown_decl(self, data):
+        self.data_open = self.chunk_end = False
+
+    def handle_endtag(self, tag):
+        self.data_open = self.chunk_end = False
+        HTMLClean.handle_endtag(self, tag)
+        # paragraphs outside of hyperlinks are finished
+        if (tag == "div" or tag == "p") and len(self.anchors) == 0:
+            self.flush()
+
+    def flush(self):
+        """Normalize the text up to the end of a paragraph,
+        except for trailing whitespace, which depends on the text
+        still to come.
+        """
+        split = len(self.result)
+        fulltext = u''.join(self.result[:split])
+        head = fulltext.rstrip()
+        # the text can only be normalized in parts split up at
+        # two or more linebreaks (see normalize_whitespace)
+        if fulltext[len(head):].count('\n') < 2:
+            return
+        if not self.started:
+            head = head.lstrip()
+        if head == '':
+            return
+        self.started = True
+        self.text.append(normalize_whitespace(head))
+        # keep the pieces of trailing whitespace
+        tail = len(fulltext) - len(fulltext.rstrip())
+        pieces = []
+        index = split
+        while tail > 0:
+            index -= 1
+            piece = self.result[index]
+            if len(piece) > tail:
+                piece = piece[-tail:]
+            pieces.append(piece)
+            tail -= len(piece)
+        pieces.reverse()
+        self.result[:split] = pieces
+
+ASCII_LETTERS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+# tags HTMLClean does anything with
+HTML_TAGS = frozenset(['a', 'br', 'div', 'p', 'script', 'style'])
+# start tags which any rules of html.parser read the same way:
+# a tag name and attributes separated by whitespace, their values
+# in quotes or without any quotes, whitespace or '='
+SIMPLE_STARTTAG = re.compile('<([a-zA-Z][^\t\n\r\f />\x00]*)'
+    '(?:\\s+[^\\s/>"\'=]+(?:\\s*=\\s*(?:"[^"]*"|\'[^\']*\'|[^\\s"\'=>]+))?)*'
+    '\\s*(/?)>')
+# the patterns html.parser finds the end of start tags, tag names,
+# attributes, end tags and the end of comments with, as of Python 3.11;
+# other versions of html.parser may read malformed HTML differently
+# (see check_html_fast and benchmarks/htmlcheck.py)
+STARTTAG_END = re.compile('<[a-zA-Z][^\t\n\r\f />\x00]*'
+    '(?:[\\s/]*(?:(?<=[\'"\\s/])[^\\s/>][^\\s/=>]*'
+    '(?:\\s*=+\\s*(?:\'[^\']*\'|"[^"]*"|(?![\'"])[^>\\s]*)\\s*)?'
+    '(?:\\s|/(?!>))*)*)?\\s*')
+TAG_NAME = re.compile('([a-zA-Z][^\t\n\r\f />\x00]*)(?:\\s|/(?!>))*')
+ATTRIBUTE = re.compile('((?<=[\'"\\s/])[^\\s/>][^\\s/=>]*)'
+    '(\\s*=+\\s*(\'[^\']*\'|"[^"]*"|(?![\'"])[^>\\s]*))?(?:\\s|/(?!>))*')
+ENDTAG = re.compile('</\\s*([a-zA-Z][-.a-zA-Z0-9:_]*)\\s*>')
+COMMENT_END = re.compile('--\\s*>')
+# characters ending a character reference
+CHARREF_END = re.compile('[\\s;]')
+
+class HTMLFast(HTMLClean):
+    """Faster version of HTMLClean giving the same result.
+
+    Reads HTML the way html.parser does, but only passes the tags
+    HTMLClean uses on to its methods, skips the content of script and
+    style elements right away and only reads the attributes of these
+    tags. Anything out of the ordinary (marked sections, text looking
+    like a start tag which is none) and all HTML after it is left
+    to html.parser.
+
+    The rules for malformed HTML are copied from html.parser of
+    Python 3.11, so html_backend only uses this class if it reads HTML
+    like html.parser of the running Python (see check_html_fast).
+    """
+    def reset(self):
+        HTMLClean.reset(self)
+        # pattern of the end tag of the script or style element the HTML
+        # continues in (cdata_elem, kept up to date for html.parser)
+        self.cdata_end = None
+        self.parser_only = False
+
+    def feed(self, data):
+        """Feed HTML to the parser.
+        """
+        if self.parser_only:
+            HTMLClean.feed(self, data)
+            return
+        from html import unescape
+
+        rawdata = self.rawdata + data
+        result = self.result
+        startswith = rawdata.startswith
+        i = 0
+        n = len(rawdata)
+        while i < n:
+            if self.cdata_elem is not None:
+                match = self.cdata_end.search(rawdata, i)
+                if match is None:
+                    break
+                # the content is skipped, HTMLClean would remove it
+                # at the end tag
+                self.handle_endtag(self.cdata_elem)
+                self.clear_cdata_mode()
+                self.cdata_end = None
+                i = match.end()
+                continue
+            j = rawdata.find('<', i)
+            if j < 0:
+                # wait for the rest of a character reference at the end
+                amppos = rawdata.rfind('&', max(i, n - 34))
+                if amppos >= 0 and CHARREF_END.search(rawdata, amppos) is None:
+                    break
+                j = n
+            if i < j:
+                text = rawdata[i:j]
+                if '&' in text:
+                    text = unescape(text)
+                result.append(text)
+                i = j
+                if i == n:
+                    break
+            if i + 1 == n:
+                break
+            char = rawdata[i + 1]
+            if char in ASCII_LETTERS:
+                k = self.read_starttag(rawdata, i)
+            elif char == '/':
+                k = self.read_endtag(rawdata, i)
+            elif startswith('<!--', i):
+                match = COMMENT_END.search(rawdata, i + 4)
+                k = match.end() if match is not None else -1
+            elif startswith('<![', i):
+                k = None
+            elif char == '!' or char == '?':
+                if rawdata[i:i + 9].lower() == '<!doctype':
+                    k = rawdata.find('>', i + 9)
+                else:
+                    k = rawdata.find('>', i + 2)
+                if k >= 0:
+                    k += 1
+            else:
+                result.append('<')
+                k = i + 1
+            if k is None:
+                # leave the rest to html.parser
+                self.parser_only = True
+                self.rawdata = ''
+                HTMLClean.feed(self, rawdata[i:])
+                return
+            if k < 0:
+                break
+            i = k
+        self.rawdata = rawdata[i:]
+
+    def read_starttag(self, rawdata, i):
+        """Handle the start tag at i and return its end, -1 if it is
+        not complete yet or None if it is not read as a tag.
+        """
+        match = SIMPLE_STARTTAG.match(rawdata, i)
+        if match is not None:
+            endpos = match.end()
+            tag = match.group(1).lower()
+            if tag not in HTML_TAGS:
+                return endpos
+            # only the attributes of hyperlinks are of any use
+            if tag != 'a':
+                self.handle_tag(tag, [], match.group(2) == '/')
+                return endpos
+        else:
+            endpos = STARTTAG_END.match(rawdata, i).end()
+            if rawdata.startswith('>', endpos):
+                endpos += 1
+            elif rawdata.startswith('/>', endpos):
+                endpos += 2
+            elif (endpos == len(rawdata)
+                    or rawdata[endpos] in ASCII_LETTERS + '=/'):
+                return -1
+            else:
+                return None
+        # read the tag name and attributes like html.parser
+        from html import unescape
+
+        match = TAG_NAME.match(rawdata, i + 1)
+        tag = match.group(1).lower()
+        k = match.end()
+        attrs = []
+        while k < endpos:
+            match = ATTRIBUTE.match(rawdata, k)
+            if match is None:
+                break
+            attrname, rest, attrvalue = match.group(1, 2, 3)
+            if not rest:
+                attrvalue = None
+            elif (attrvalue[:1] == '\'' == attrvalue[-1:]
+                    or attrvalue[:1] == '"' == attrvalue[-1:]):
+                attrvalue = attrvalue[1:-1]
+            if attrvalue:
+                attrvalue = unescape(attrvalue)
+            attrs.append((attrname.lower(), attrvalue))
+            k = match.end()
+        end = rawdata[k:endpos].strip()
+        if end not in ('>', '/>'):
+            return None
+        if tag in HTML_TAGS:
+            self.handle_tag(tag, attrs, end == '/>')
+        return endpos
+
+    def handle_tag(self, tag, attrs, startend):
+        """Handle a start tag, which also ends the element if startend.
+        """
+        self.handle_starttag(tag, attrs)
+        if startend:
+            self.handle_endtag(tag)
+        elif tag == 'script' or tag == 'style':
+            self.set_cdata_mode(tag)
+            self.cdata_end = re.compile('</\\s*{}\\s*>'.format(tag), re.I)
+
+    def read_endtag(self, rawdata, i):
+        """Handle the end tag at i and return its end,
+        or -1 if it is not complete yet.
+        """
+        match = ENDTAG.match(rawdata, i)
+        if match is not None:
+            tag = match.group(1).lower()
+            end = match.end()
+        else:
+            gtpos = rawdata.find('>', i + 1)
+            if gtpos < 0:
+                return -1
+            match = TAG_NAME.match(rawdata, i + 2)
+            if match is None:
+                # </> or a bogus comment
+                if rawdata.startswith('</>', i):
+                    return i + 3
+                return gtpos + 1
+            tag = match.group(1).lower()
+            end = rawdata.find('>', match.end()) + 1
+        if tag in HTML_TAGS:
+            self.handle_endtag(tag)
+        return end
+
+# classes to read HTML with by name (see --html-backend),
+# giving the same result
+HTML_BACKENDS = {'htmlparser': HTMLClean, 'fast': HTMLFast}
+# malformed HTML read differently by some versions of html.parser
+HTML_FAST_CHECKS = ['<p>a<!--x--!>b</p>c', '<!-->text<p>x', '<!--->text',
+    '</ p>x', '</>x', '</p x>y', '<a href="http://a.b"x=y/z>l</a>',
+    '<script>a</script/x>b<p>c', '<script>a</script\t>b</p>',
+    '<style>x</style >y', '<![CDATA[ x ]]>z', '<!x>w', '<?pi x>v',
+    '<br\n/>u', "<a b==c href='http://q.r'>t</a>", '<p/>s',
+    '<a\thref="http://t.u"/>r</a>', '<div</div>q', '<1>p',
+    '<a href=http://x.y/>z</a>', '<a  href = "http://s.t" >u</A >',
+    '&amp;&#x41;&bogus;&eacute x', '<!DOCTYPE html><title>t</title>']
+
+@functools.lru_cache(maxsize=None)
+def check_html_fast():
+    """Return whether HTMLFast reads the HTML in HTML_FAST_CHECKS like
+    HTMLClean (html.parser of the running Python) does.
+    """
+    for document in HTML_FAST_CHECKS:
+        results = []
+        for backend in (HTMLClean, HTMLFast):
+            content = backend()
+            content.feed(document)
+            results.append((content.result, content.anchors,
+                content.concatenate()))
+        if results[0] != results[1]:
+            return False
+    return True
+
+def html_backend(name):
+    """Return the class to read whole HTML documents with by name
+    (see HTML_BACKENDS). HTMLClean is used instead of HTMLFast, with
+    a warning, if HTMLFast reads HTML differently from html.parser
+    of the running Python.
+    """
+    if name == 'fast' and not check_html_fast():
+        import warnings
+
+        warnings.warn("html.parser of Python {} reads HTML differently "
+            "from the fast HTML backend; using html.parser".format(
+            sys.version.split()[0]), RuntimeWarning)
+        name = 'htmlparser'
+    return HTML_BACKENDS[name]
+
+# whitespace that gets changed: runs of whitespace including linebreaks
+# as well as runs of spaces and tabs other than a single space
+WHITESPACE = re.compile('[ \t]*\n[ \t\n]*|[ \t]{2,}|\t')
+# changes to whitespace including linebreaks which do not depend on
+# the text around it, applied in this order
+LINEBREAKS = [
+    (re.compile('([ \t]*\n[ \t]+|[ \t]*\n[ \t]+)'), ' '),
+    (re.compile('([ \t]*\n\n[ \t]+|[ \t]*\n\n[ \t]+)'), '\n\n'),
+    (re.compile('([\t ]*\n[\n \t]+)'), '\n\n'),
+    (re.compile('[ \t]+'), ' '),
+    (re.compile('([\n]{2,})'), '\n\n'),
+]
+linebreak_runs = {}
+
+def normalize_linebreaks(run):
+    """Change a run of whitespace including linebreaks
+    which is not joined with the text around it.
+    """
+    try:
+        return linebreak_runs[run]
+    except KeyError:
+        pass
+    normalized = run
+    for pattern, replacement in LINEBREAKS:
+        normalized = pattern.sub(replacement, normalized)
+    # keep the cache small, most documents only use a few runs
+    if len(linebreak_runs) >= 4096:
+        linebreak_runs.clear()
+    linebreak_runs[run] = normalized
+    return normalized
+
+def is_word(char):
+    """Check if char is matched by \\w in regular expressions.
+    """
+    return char.isalnum() or char == '_'
+
+def normalize_whitespace(fulltext):
+    """Remove various whitespace combinations found in HTML.
+    Whitespace that contains two or more linebreaks is changed
+    independently of the text around it, so text can be normalized
+    in parts split up at such whitespace.
+
+    A single linebreak surrounded by spaces or tabs gets joined with
+    the text around it into one line, once with word characters on
+    both sides, once with other non-whitespace characters
+    and a space or tab after the linebreak. The character between
+    two linebreaks joined like this can only be used in one of them.
+    Any other whitespace including linebreaks is normalized
+    by normalize_linebreaks and remaining runs of spaces and tabs
+    are changed to a single space.
+    """
+    textlength = len(fulltext)
+    # end of the last joined whitespace and how it was joined
+    joined = [-2, 0]
+
+    def replace(matchobj):
+        run = matchobj.group(0)
+        start, end = matchobj.span()
+        if '\n' not in run:
+            return ' '
+        if start > 0 and end < textlength and run.count('\n') == 1:
+            before = fulltext[start - 1]
+            after = fulltext[end]
+            if joined[0] == start - 1:
+                previous = joined[1]
+            else:
+                previous = 0
+            if previous != 1 and is_word(before) and is_word(after):
+                joined[:] = [end, 1]
+                return ' '
+            if (previous != 2 and run[-1] != '\n'
+                    and not before.isspace() and not after.isspace()):
+                joined[:] = [end, 2]
+                return ' '
+        return normalize_linebreaks(run)
+
+    return WHITESPACE.sub(replace, fulltext)
+
+def html_to_text(html, backend='htmlparser'):
+    content = html_backend(backend)()
+    content.feed(html)
+    return content.concatenate()
+
+def iter_html_to_text(chunks):
+    """Convert HTML read in chunks to plaintext and yield
+    the plaintext paragraph by paragraph.
+    """
+    content = HTMLStream()
+    for chunk in chunks:
+        content.feed(chunk)
+        for text in content.pop_text():
+            yield text
+    content.finish()
+    for text in content.pop_text():
+        yield text
+
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+'''
+Change Markdown to plaintext, keeping the URLs of links in round
+brackets after their text to be converted to footnotes.
+
+Imported on first use by a Converter reading Markdown, so the patterns
+below are only compiled when Markdown is converted.
+'''
+
+# Python2
+from __future__ import unicode_literals
+import re
+
+from textref.core import is_url, hide_brackets, escape_hidden
+
+# Markdown inline links and images [text](url "title") (with square
+# brackets nested once in the text and round brackets in the URL),
+# autolinks <url> and <address@example.com>, as well as code spans,
+# backslash escapes and reference-style links [text][id] (not supported,
+# so left alone), which may contain brackets that are no links
+MARKDOWN_LINK = re.compile(""
+    "(?#check for code spans)"
+    "(?P<code>(?P<ticks>`+).*?(?<!`)(?P=ticks)(?!`))"
+    "|(?#check for backslash escapes)"
+    "\\\\(?P<escaped>[!-/:-@\\[-`{-~])"
+    "|(?#check for inline links and images)"
+    "(?P<image>!?)\\[(?P<text>(?:[^\\[\\]\\\\]|\\\\.|\\[[^\\[\\]]*\\])*)\\]"
+    "\\([ \t]*<?(?P<url>(?:[^\\s()<>]|\\([^\\s()]*\\))*)>?"
+    "(?:[ \t]+(?:\"[^\"]*\"|'[^']*'|\\([^()]*\\)))?[ \t]*\\)"
+    "|(?#check for reference-style links and images)"
+    "(?P<reference>!?\\[(?:[^\\[\\]\\\\]|\\\\.|\\[[^\\[\\]]*\\])*\\]"
+    "\\[(?:[^\\[\\]\\\\]|\\\\.)*\\])"
+    "|(?#check for autolinks)"
+    "<(?P<autolink>[A-Za-z][A-Za-z0-9+.-]{1,31}:[^\\s<>]*"
+    "|[^\\s<>@]+@[^\\s<>@]+\\.[^\\s<>@]+)>", re.DOTALL)
+# lines defining the URL of reference-style links: [id]: url
+MARKDOWN_DEFINITION = re.compile(' {0,3}\\[(?:[^\\[\\]\\\\]|\\\\.)+\\]:')
+# lines opening and closing fenced code blocks
+MARKDOWN_FENCE = re.compile(' {0,3}(`{3,}(?=[^`]*$)|~{3,})')
+# lines of indented code blocks (relative to the list item they are in)
+# unless they continue a paragraph
+MARKDOWN_INDENTED = re.compile('(?: {4}| {0,3}\t)[ \t]*\\S')
+# lines starting list items (but no thematic breaks like * * *), up to
+# the text of the item (unless it is indented by more than 4 spaces, and
+# so indented code)
+MARKDOWN_ITEM = re.compile('(?! {0,3}([-*_])(?:[ \t]*\\1){2,}[ \t]*$)'
+    '(?P<marker> {0,3}(?:[-+*]|[0-9]{1,9}[.)]))(?: {1,4}(?=\\S)|[ \t]|$)')
+
+def markdown_link(matchobj):
+    """Change a Markdown link to its text followed by its URL in round
+    brackets (if it is a URL), like a hyperlink converted from HTML,
+    and an image to its alternative text. Brackets in code spans and
+    reference-style links and square brackets left in the text of links
+    are hidden (see hide_brackets).
+    """
+    code, escaped, image, text, url, autolink, reference = matchobj.group(
+        'code', 'escaped', 'image', 'text', 'url', 'autolink', 'reference')
+    if code is not None:
+        return hide_brackets(code)
+    if reference is not None:
+        return hide_brackets(reference)
+    if escaped is not None:
+        return escaped
+    if autolink is not None:
+        text = url = autolink
+    else:
+        # links and images in the text of links
+        text = hide_brackets(MARKDOWN_LINK.sub(markdown_link, text), '[]')
+        if image != '':
+            return text
+    if is_url(url):
+        # keep round brackets in URLs from ending the reference
+        return "{} ({})".format(text, url.replace('(', '%28').replace(')',
+            '%29'))
+    return text
+
+def indentation(line):
+    """Return the number of columns line is indented by, tabs counting
+    to the next multiple of 4 columns.
+    """
+    return len(line[:len(line) - len(line.lstrip(' \t'))].expandtabs(4))
+
+def dedent(line, columns):
+    """Return line with up to columns of its indentation removed.
+    """
+    text = line.lstrip(' \t')
+    indent = line[:len(line) - len(text)].expandtabs(4)
+    return indent[min(columns, len(indent)):] + text
+
+def iter_markdown_to_text(lines):
+    """Convert the links in lines of Markdown and yield the resulting
+    lines paragraph by paragraph (as links can continue on the next
+    line). Fenced and indented code blocks are left as they are, except
+    for their brackets being hidden (see hide_brackets), and so are
+    the lines defining reference-style links. Lines continuing list
+    items are read relative to the indentation of the text of the item.
+    Noncharacters in the lines are escaped (see escape_hidden).
+    """
+    paragraph = []
+    fence = None
+    # columns the text of the list items the line is in is indented by
+    items = []
+    for line in lines:
+        line = escape_hidden(line)
+        # less indented lines end list items, unless they continue a
+        # paragraph or start another item
+        if (fence is None and len(items) > 0 and line.strip() != ''
+                and (len(paragraph) == 0
+                or MARKDOWN_ITEM.match(line.lstrip(' \t')) is not None)):
+            width = indentation(line)
+            while len(items) > 0 and width < items[-1]:
+                items.pop()
+        inner = dedent(line, items[-1]) if len(items) > 0 else line
+        opened = MARKDOWN_FENCE.match(inner)
+        if fence is not None:
+            # closing fence: at least as long as the opening one
+            if (opened is not None and opened.group(1)[0] == fence[0]
+                    and len(opened.group(1)) >= len(fence)
+                    and inner[opened.end():].strip() == ''):
+                fence = None
+            yield hide_brackets(line)
+            continue
+        if len(paragraph) == 0 and MARKDOWN_INDENTED.match(inner) is not None:
+            yield hide_brackets(line)
+            continue
+        item = MARKDOWN_ITEM.match(inner)
+        if item is not None:
+            items.append(indentation(line) - indentation(inner)
+                + max(item.end(), len(item.group('marker')) + 1))
+        defined = MARKDOWN_DEFINITION.match(inner)
+        if opened is not None or defined is not None or line.strip() == '':
+            if len(paragraph) > 0:
+                for line_out in MARKDOWN_LINK.sub(markdown_link,
+                        ''.join(paragraph)).splitlines(True):
+                    yield line_out
+                paragraph = []
+            if opened is not None:
+                fence = opened.group(1)
+                line = hide_brackets(line)
+            elif defined is not None:
+                line = hide_brackets(line)
+            yield line
+        else:
+            paragraph.append(line)
+    if len(paragraph) > 0:
+        for line_out in MARKDOWN_LINK.sub(markdown_link,
+                ''.join(paragraph)).splitlines(True):
+            yield line_out
+
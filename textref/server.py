@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+'''
+Convert many documents at once: concurrently from asyncio code
+(convert_many) and as a server on a Unix socket (serve), with a client
+for it (request_conversion).
+
+Imported on first use, so asyncio and concurrent.futures are only
+loaded by programs which convert documents this way.
+'''
+
+# Python2
+from __future__ import unicode_literals
+import os
+import stat
+
+try:
+    # Python2
+    from io import open
+except ImportError:
+    # Python3
+    pass
+
+from textref.core import convert_text, MAX_DOCUMENT_SIZE
+
+def convert_document_or_file(document, options=None):
+    """Convert a text, or the file at a path (os.PathLike), in a worker
+    of convert_many. Files ending in .htm or .html are converted as
+    HTML and files ending in .md as Markdown unless the options say
+    otherwise.
+    """
+    if isinstance(document, str):
+        return convert_text(document, options)
+    path = os.fspath(document)
+    options = dict(options or {})
+    if 'html' not in options:
+        options['html'] = os.path.splitext(path)[1] in ('.htm', '.html')
+    if 'markdown' not in options:
+        options['markdown'] = os.path.splitext(path)[1] == '.md'
+    with open(path, 'r', encoding='utf-8') as f:
+        return convert_text(f.read(), options)
+
+async def convert_many(documents, options=None, concurrency=None,
+        executor=None):
+    """Convert documents concurrently and yield the results
+    as they complete.
+
+    documents is an iterable or an asynchronous iterable of texts (str)
+    and paths of files (os.PathLike, like pathlib.Path). Files are read
+    and documents converted on executor (by default a pool of
+    concurrency processes), so the event loop is never blocked.
+    At most concurrency documents (by default the number of CPUs)
+    are taken from documents and converted at a time; no more are taken
+    while the caller does not ask for the next result. Closing the
+    generator (or cancelling the task iterating over it) cancels
+    the conversions which have not started yet.
+
+    Yields (document, output, references, error) for every document:
+    output and references as returned by convert_text, or None and
+    the exception raised in error.
+    """
+    import asyncio
+    import concurrent.futures
+
+    loop = asyncio.get_running_loop()
+    if concurrency is None:
+        concurrency = os.cpu_count() or 1
+    own_executor = executor is None
+    if own_executor:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=concurrency)
+    if hasattr(documents, '__aiter__'):
+        documents = documents.__aiter__()
+        next_document = documents.__anext__
+    else:
+        documents = iter(documents)
+        async def next_document():
+            try:
+                return next(documents)
+            except StopIteration:
+                raise StopAsyncIteration
+    # conversions started: future -> document
+    pending = {}
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                try:
+                    document = await next_document()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                future = loop.run_in_executor(executor,
+                    convert_document_or_file, document, options)
+                pending[future] = document
+            if len(pending) == 0:
+                break
+            done, running = await asyncio.wait(pending,
+                return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                document = pending.pop(future)
+                try:
+                    output, references = future.result()
+                except Exception as e:
+                    yield document, None, None, e
+                else:
+                    yield document, output, references, None
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def convert_document(data, options, cache=None):
+    """Convert a document received by the server
+    and return the output encoded as UTF-8.
+    Look up and store the output in cache if given.
+    """
+    if cache is not None:
+        key = cache.key(data, options)
+        cached = cache.get(key)
+        if cached is not None:
+            with cached:
+                return cached.read().encode('utf-8')
+    output, references = convert_text(data.decode('utf-8'), options)
+    if cache is not None:
+        cache.put(key, [output])
+    return output.encode('utf-8')
+
+def serve(socket_path, options, jobs=None, cache=None):
+    """Convert documents sent to a Unix socket until interrupted.
+
+    Every request is a document encoded as UTF-8, preceded by its length
+    in bytes (4 bytes, unsigned, big-endian). Every response consists of
+    a status byte (0 for success, 1 for an error), the length of the
+    payload (4 bytes as above) and the payload: the converted document,
+    or the error message. A client can send any number of documents over
+    one connection; documents are converted on a pool of jobs processes,
+    sharing a ResultCache if cache is given.
+    """
+    import asyncio
+    import concurrent.futures
+    import signal
+    import struct
+
+    # signals are handled by the server process only
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs,
+        initializer=signal.signal, initargs=(signal.SIGINT, signal.SIG_IGN))
+
+    async def handle(reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(4)
+                except asyncio.IncompleteReadError:
+                    break
+                length = struct.unpack('!I', header)[0]
+                if length > MAX_DOCUMENT_SIZE:
+                    payload = "Document too large.".encode('utf-8')
+                    writer.write(struct.pack('!BI', 1, len(payload)) + payload)
+                    break
+                data = await reader.readexactly(length)
+                try:
+                    payload = await loop.run_in_executor(pool,
+                        convert_document, data, options, cache)
+                    status = 0
+                except Exception as e:
+                    payload = "{}: {}".format(type(e).__name__, e).encode('utf-8')
+                    status = 1
+                writer.write(struct.pack('!BI', status, len(payload)) + payload)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def run():
+        # shut down cleanly on Ctrl-C and when terminated
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            asyncio.get_running_loop().add_signal_handler(signum, stop.set)
+        server = await asyncio.start_unix_server(handle, path=socket_path)
+        print("Listening on {}".format(socket_path)) # status msg
+        async with server:
+            await stop.wait()
+
+    # remove the socket of a server that did not shut down cleanly
+    if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+        os.remove(socket_path)
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+def request_conversion(socket_path, text):
+    """Send text to a server started with --serve and return
+    the converted text.
+    """
+    import socket
+    import struct
+
+    def receive(sock, length):
+        data = b''
+        while len(data) < length:
+            chunk = sock.recv(length - len(data))
+            if not chunk:
+                raise ConnectionError("Connection closed by the server.")
+            data += chunk
+        return data
+
+    data = text.encode('utf-8')
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        sock.sendall(struct.pack('!I', len(data)) + data)
+        status, length = struct.unpack('!BI', receive(sock, 5))
+        payload = receive(sock, length).decode('utf-8')
+    finally:
+        sock.close()
+    if status != 0:
+        raise RuntimeError(payload)
+    return payload
+